@@ -0,0 +1,369 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from bookings import free_slots
+from cache import page_cache, venue_key, artist_key
+from facets import requested_genres, genre_filter, genre_counts
+from http_cache import conditional, venues_validators, artists_validators, artists_with_shows_validators, shows_validators, venue_validators, artist_validators
+from models import db, Venue, Artist
+from queries import current_time, venue_page, artist_page, page_expiry, show_listing, decode_cursor
+from replicas import replicas
+from search import find_venues, find_artists, search_results
+from geo import nearest_venues, decode_cursor as decode_distance_cursor
+from geocoding import places, requested_position
+from show_calendar import parse_time, requested_show_filters, requested_month, day_counts, add_months
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#----------------------------------------------------------------------------#
+# JSON API, version 1.
+#
+# The same queries as the HTML views, without the template. Lists are paged
+# with keyset cursors (?after=, plus ?before= on shows) and ?limit=; every
+# route takes ?fields=a,b,c to return only those keys of each listed item
+# (of the body, on detail routes), and the venue and artist lists then
+# select only those columns (num_upcoming_shows is the show_counts
+# counter). Lists and search take ?genre= (repeatable) to keep
+# the rows listing every one of those genres, and /venues/genres and
+# /artists/genres count the genres over such a selection. List and detail
+# routes answer conditional GETs through http_cache, search responses get an
+# ETag hashed from the body.
+# /venues/<id>/free-slots lists the gaps between a venue's bookings. Every
+# route reads from a replica when there is one, see replicas.py.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def error(status, message):
+    abort(json_response({"error": message}, status))
+
+
+def requested_fields(available):
+    """The ?fields= selection, checked against `available`; None means all."""
+    if 'fields' not in request.args:
+        return None
+    fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown or not fields:
+        error(400, 'fields must be a comma-separated subset of: %s' % ', '.join(available))
+    return fields
+
+
+def select_fields(item, fields):
+    if fields is None:
+        return item
+    return dict((field, item[field]) for field in fields)
+
+
+def page_size():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+VENUE_COLUMNS = {
+    "id": Venue.id,
+    "name": Venue.name,
+    "city": Venue.city,
+    "state": Venue.state,
+    "address": Venue.address,
+    "phone": Venue.phone,
+    "genres": Venue.genres,
+    "image_link": Venue.image_link,
+    "facebook_link": Venue.facebook_link,
+    "website": Venue.website_link,
+    "seeking_talent": Venue.seeking_talent,
+    "seeking_description": Venue.seeking_description,
+    "latitude": Venue.latitude,
+    "longitude": Venue.longitude,
+    "num_upcoming_shows": Venue.upcoming_shows_count,
+}
+
+NEAR_FIELDS = ('id', 'name', 'city', 'state', 'address', 'latitude', 'longitude', 'distance_km')
+
+ARTIST_COLUMNS = {
+    "id": Artist.id,
+    "name": Artist.name,
+    "city": Artist.city,
+    "state": Artist.state,
+    "phone": Artist.phone,
+    "genres": Artist.genres,
+    "image_link": Artist.image_link,
+    "facebook_link": Artist.facebook_link,
+    "website": Artist.website_link,
+    "seeking_venue": Artist.seeking_venue,
+    "seeking_description": Artist.seeking_description,
+    "num_upcoming_shows": Artist.upcoming_shows_count,
+}
+
+VENUE_PAGE_FIELDS = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+                     'seeking_talent', 'seeking_description', 'image_link', 'upcoming_shows', 'past_shows',
+                     'upcoming_shows_count', 'past_shows_count')
+
+ARTIST_PAGE_FIELDS = ('id', 'name', 'genres', 'city', 'state', 'phone', 'website', 'facebook_link',
+                      'seeking_venue', 'seeking_description', 'image_link', 'upcoming_shows', 'past_shows',
+                      'upcoming_shows_count', 'past_shows_count')
+
+SHOW_FIELDS = ('id', 'start_time', 'end_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link')
+
+SEARCH_FIELDS = ('id', 'name', 'num_upcoming_shows')
+
+FACET_FIELDS = ('genre', 'count')
+
+SLOT_FIELDS = ('start', 'end')
+
+CALENDAR_FIELDS = ('date', 'count')
+
+
+def id_listing(model, columns):
+    """One page of `model` in id order, selecting only the requested columns."""
+    fields = requested_fields(list(columns)) or list(columns)
+    try:
+        after = int(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        error(400, 'after must be a cursor returned by this API')
+    limit = page_size()
+
+    selected = [columns[field].label(field) for field in fields]
+    query = db.session.query(model.id.label('_cursor'), *selected).filter(model.deleted_at.is_(None)).order_by(model.id)
+    genres = requested_genres()
+    if genres:
+        query = query.filter(genre_filter(db.session, model, genres))
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.limit(limit + 1).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return json_response({
+        "data": [dict((field, getattr(row, field)) for field in fields) for row in rows],
+        "next": str(rows[-1]._cursor) if rows and has_next else None
+    })
+
+
+def search(find):
+    fields = requested_fields(SEARCH_FIELDS)
+    term = request.args.get('q', '')
+    limit = min(request.args.get('limit', current_app.config['SEARCH_RESULTS_LIMIT'], type=int),
+                current_app.config['SEARCH_RESULTS_LIMIT'])
+    results = search_results(find(db.session, term, max(limit, 1), requested_genres()))
+    results["data"] = [select_fields(item, fields) for item in results["data"]]
+    response = json_response(results)
+    response.add_etag(hashlib.sha1(response.get_data()).hexdigest())
+    return response.make_conditional(request)
+
+
+def facet_counts(model):
+    fields = requested_fields(FACET_FIELDS)
+    genres = requested_genres()
+    return json_response({
+        "genres": genres,
+        "counts": [select_fields({"genre": genre, "count": count}, fields)
+                   for genre, count in genre_counts(db.session, model, genres)]
+    })
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@replicas.reads
+@conditional(db.session, venues_validators)
+def venues():
+    return id_listing(Venue, VENUE_COLUMNS)
+
+
+@api.route('/venues/search')
+@replicas.reads
+def search_venues():
+    return search(find_venues)
+
+
+@api.route('/venues/genres')
+@replicas.reads
+@conditional(db.session, venues_validators)
+def venue_genres():
+    return facet_counts(Venue)
+
+
+@api.route('/venues/near')
+@replicas.reads
+@conditional(db.session, venues_validators)
+def venues_near():
+    # Nearest first from ?lat=&lng=, or from the city of ?city=&state=.
+    fields = requested_fields(NEAR_FIELDS)
+    try:
+        position = requested_position(places())
+    except ValueError as e:
+        error(400, str(e))
+    try:
+        after = decode_distance_cursor(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        error(400, 'after must be a cursor returned by this API')
+    if position is None:
+        error(400, 'give lat and lng, or city and state')
+    page = nearest_venues(db.session, position[0], position[1], page_size(), after=after)
+    return json_response({
+        "data": [select_fields({
+            "id": venue["id"],
+            "name": venue["name"],
+            "city": venue["city"],
+            "state": venue["state"],
+            "address": venue["address"],
+            "latitude": venue["latitude"],
+            "longitude": venue["longitude"],
+            "distance_km": round(venue["distance"] / 1000, 3)
+        }, fields) for venue in page["venues"]],
+        "next": page["next"]
+    })
+
+
+@api.route('/venues/<int:venue_id>')
+@replicas.reads
+@conditional(db.session, venue_validators)
+def venue(venue_id):
+    fields = requested_fields(VENUE_PAGE_FIELDS)
+    body = page_cache.get_or_set(venue_key(venue_id), lambda: venue_page(db.session, venue_id), page_expiry,
+                                 store=not replicas.routed())
+    if body is None:
+        error(404, 'no such venue')
+    return json_response(select_fields(body, fields))
+
+
+def _time_arg(name, default):
+    if name not in request.args:
+        return default
+    try:
+        return parse_time(request.args[name], name)
+    except ValueError as e:
+        error(400, str(e))
+
+
+@api.route('/venues/<int:venue_id>/free-slots')
+@replicas.reads
+def venue_free_slots(venue_id):
+    fields = requested_fields(SLOT_FIELDS)
+    now = current_time()
+    start = max(_time_arg('from', now), now)
+    end = _time_arg('to', start + timedelta(days=7))
+    if not start < end <= start + timedelta(days=current_app.config['FREE_SLOTS_MAX_DAYS']):
+        error(400, 'to must be after from and at most %d days later' % current_app.config['FREE_SLOTS_MAX_DAYS'])
+    min_minutes = request.args.get('min_minutes', 1, type=int)
+    if db.session.query(Venue.id).filter(Venue.id == venue_id, Venue.deleted_at.is_(None)).scalar() is None:
+        error(404, 'no such venue')
+    slots = free_slots(db.session, venue_id, start, end, timedelta(minutes=max(min_minutes, 1)))
+    return json_response({
+        "venue_id": venue_id,
+        "from": start.strftime('%Y-%m-%d %H:%M:%S'),
+        "to": end.strftime('%Y-%m-%d %H:%M:%S'),
+        "slots": [select_fields({
+            "start": slot_start.strftime('%Y-%m-%d %H:%M:%S'),
+            "end": slot_end.strftime('%Y-%m-%d %H:%M:%S')
+        }, fields) for slot_start, slot_end in slots]
+    })
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@replicas.reads
+@conditional(db.session, artists_with_shows_validators)
+def artists():
+    return id_listing(Artist, ARTIST_COLUMNS)
+
+
+@api.route('/artists/search')
+@replicas.reads
+def search_artists():
+    return search(find_artists)
+
+
+@api.route('/artists/genres')
+@replicas.reads
+@conditional(db.session, artists_validators)
+def artist_genres():
+    return facet_counts(Artist)
+
+
+@api.route('/artists/<int:artist_id>')
+@replicas.reads
+@conditional(db.session, artist_validators)
+def artist(artist_id):
+    fields = requested_fields(ARTIST_PAGE_FIELDS)
+    body = page_cache.get_or_set(artist_key(artist_id), lambda: artist_page(db.session, artist_id), page_expiry,
+                                 store=not replicas.routed())
+    if body is None:
+        error(404, 'no such artist')
+    return json_response(select_fields(body, fields))
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@replicas.reads
+@conditional(db.session, shows_validators)
+def shows():
+    fields = requested_fields(SHOW_FIELDS)
+    try:
+        after = decode_cursor(request.args['after']) if 'after' in request.args else None
+        before = decode_cursor(request.args['before']) if 'before' in request.args else None
+    except ValueError:
+        error(400, 'after and before must be cursors returned by this API')
+    try:
+        filters = requested_show_filters()
+    except ValueError as e:
+        error(400, str(e))
+    page = show_listing(db.session, page_size(), after=after, before=before, criteria=filters.criteria(db.session))
+    return json_response({
+        "data": [select_fields({
+            "id": show.id,
+            "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "end_time": show.end_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "venue_id": show.venue_id,
+            "venue_name": show.venue_name,
+            "artist_id": show.artist_id,
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link
+        }, fields) for show in page["shows"]],
+        "next": page["next"],
+        "prev": page["prev"]
+    })
+
+
+@api.route('/shows/calendar')
+@replicas.reads
+@conditional(db.session, shows_validators)
+def show_calendar():
+    # The number of shows on each day of ?month=, under the same filters as
+    # /shows less from and to.
+    fields = requested_fields(CALENDAR_FIELDS)
+    try:
+        filters = requested_show_filters()
+        month = requested_month(filters, current_time())
+    except ValueError as e:
+        error(400, str(e))
+    next_month = add_months(month, 1)
+    counts = day_counts(db.session, month, next_month, filters)
+    days = [month + timedelta(days=i) for i in range((next_month - month).days)]
+    return json_response({
+        "month": month.strftime('%Y-%m'),
+        "days": [select_fields({"date": day.isoformat(), "count": counts.get(day, 0)}, fields) for day in days],
+        "total": sum(counts.values())
+    })
@@ -5,58 +5,128 @@
 from email.policy import default
 import json
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_moment import Moment
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from itsdangerous import exc
 from forms import *
+import signal
 import sys
-from flask_sqlalchemy import SQLAlchemy
+import time
+from db_pool import pool_status, dispose_pools_after_fork
 from flask_migrate import Migrate
 from collections.abc import Callable
-from datetime import datetime
+from functools import lru_cache
+from datetime import datetime, timedelta
 import collections
+import hmac
+import click
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+from models import db, Venue, Artist, Show, Job, DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+from queries import venue_directory, artist_directory, venue_page, artist_page, page_expiry, find_venue, find_artist, is_upcoming, show_listing, decode_cursor, current_time
+from search import find_venues, find_artists, search_results, search_genre_counts
+from facets import requested_genres, genre_counts, facet_links
+from cache import page_cache, venue_key, artist_key, venue_page_keys, artist_page_keys
+from http_cache import conditional, venues_validators, artists_validators, shows_validators, venue_validators, artist_validators
+from query_stats import QueryStats
+from api import api
+import async_views
+from templating import templating
+from jobs import jobs
+from replicas import replicas
+import show_counts
+import show_calendar
+import geocoding
+from geo import nearest_venues, decode_cursor as decode_distance_cursor, METRES_PER_MILE
+from show_calendar import requested_show_filters, requested_month, month_calendar, add_months
+import bookings
+from importer import import_records, detect_format, KINDS, FORMATS
+import exporter
+
+moment = Moment()
+migrate = Migrate()
+query_stats = QueryStats()
+# cli_group=None puts the blueprint's commands at the top level: `flask import`.
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config=None):
+  """Build a Fyyur application.
+
+  `config` overrides the settings in config.py, either as a mapping or as
+  the import name of a config object. Nothing here touches the database:
+  the engine is created on first use, so servers can import the app and
+  fork workers before any connection exists.
+  """
+  app = Flask(__name__)
+  app.config.from_object('config')
+  if isinstance(config, str):
+    app.config.from_object(config)
+  elif config:
+    app.config.from_mapping(config)
+
+  db.init_app(app)
+  migrate.init_app(app, db)
+  moment.init_app(app)
+  page_cache.init_app(app)
+  templating.init_app(app)
+  query_stats.init_app(app)
+  jobs.init_app(app)
+  replicas.init_app(app)
+  dispose_pools_after_fork(app)
+  app.register_blueprint(bp)
+  app.register_blueprint(api)
+  if app.config['ASYNC_READS']:
+    async_views.init_app(app)
+
+  if not app.debug and not app.testing:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
 
-from models import Venue, Artist, Show
+  return app
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+EN = babel.Locale('en')
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, format):
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  return babel.dates.format_datetime(value, DATETIME_FORMATS.get(format, format), locale=EN)
+
+@bp.app_template_filter('datetime')
 def format_datetime(value, format='medium'):
+  # Takes datetimes as they come from the database (or the strings cached
+  # pages hold); each distinct time is formatted once per process.
   try:
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format="EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format="EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+    return _format_datetime(value, format)
   except:
     print(sys.exc_info())
 
-app.jinja_env.filters['datetime'] = format_datetime
-
-current_time = datetime.now().strftime('%Y-%m-%d %H:%S:%M')
-
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -64,112 +134,76 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@replicas.reads
+@conditional(db.session, venues_validators)
 def venues():
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  venues_states_and_areas = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-  returnValue = []
-  
-  for city_and_state in venues_states_and_areas: 
-    venues_in_city_and_state = db.session.query(Venue.id, Venue.name).filter(Venue.city == city_and_state[0], Venue.state == city_and_state[1]).all()
-    returnValue.append({
-      "city": city_and_state[0],
-      "state": city_and_state[1],
-      "venues": []
-    })
-    for venue_in_city_and_state in venues_in_city_and_state: 
-      upcomingEvents = db.session.query(Show.venue_id, Show.start_time).filter(Show.venue_id == venue_in_city_and_state[0], Show.start_time > current_time).all()
-      returnValue[len(returnValue) - 1]["venues"].append({
-        "id": venue_in_city_and_state[0],
-        "name": venue_in_city_and_state[1],
-        "num_upcoming_shows": len(upcomingEvents)
-      })
-  return render_template('pages/venues.html', areas=returnValue)
-
-
-
-@app.route('/venues/search', methods=['POST'])
+  # num_upcoming_shows is aggregated per venue in the same statement that
+  # lists the venues, see queries.venue_directory.
+  genres = requested_genres()
+  areas = venue_directory(db.session, genres)
+  facets = facet_links(genre_counts(db.session, Venue, genres), genres)
+  return render_template('pages/venues.html', areas=areas, facets=facets)
+
+
+
+@bp.route('/venues/search', methods=['GET', 'POST'])
+@replicas.reads
 def search_venues():
   # TODO: implement search on venues with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   
-  search_term = request.form['search_term']
-  venues_matching_search_term = db.session.query(Venue).filter(Venue.name.ilike('%' + search_term + '%')).all()
-  
-  response = {
-    "count": len(venues_matching_search_term),
-    "data": []
-  }
+  # The search box posts; the genre facet links come back as GETs.
+  search_term = request.values.get('search_term', '')
+  genres = requested_genres()
+  venues_matching_search_term = find_venues(db.session, search_term, current_app.config['SEARCH_RESULTS_LIMIT'], genres)
   
-  for venue in venues_matching_search_term: 
-    upcoming_shows = []
-    shows = db.session.query(Show).filter(Show.venue_id == venue.id).all()
-    
-    for show in shows: 
-      if show.start_time.strftime('%Y-%m-%d %H:%M:%S') > current_time: 
-        upcoming_shows.append(show)  
-        
-    response["data"].append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(upcoming_shows)
-    })
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
+  response = search_results(venues_matching_search_term)
+  facets = facet_links(search_genre_counts(db.session, Venue, search_term, genres), genres)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term, facets=facets)
+
+@bp.route('/venues/near')
+@replicas.reads
+@conditional(db.session, venues_validators)
+def venues_near():
+  # venues nearest a position (the browser's, or a city's), one page at a
+  # time; see geo.nearest_venues
+  error = position = after = None
+  try:
+    position = geocoding.requested_position(geocoding.places())
+    after = decode_distance_cursor(request.args['after']) if 'after' in request.args else None
+  except ValueError as e:
+    # e.g. a city the lookup table lacks: say so on the page
+    error = str(e)
+  page = {"venues": [], "next": None}
+  if position is not None:
+    page = nearest_venues(db.session, position[0], position[1], current_app.config['VENUES_NEAR_PER_PAGE'], after=after)
+  # Links to the next page keep the position as given.
+  args = dict((name, request.args[name]) for name in ('lat', 'lng', 'city', 'state') if request.args.get(name))
+  return render_template('pages/venues_near.html', venues=page["venues"], next_cursor=page["next"], position=position,
+                         args=args, error=error, metres_per_mile=METRES_PER_MILE)
+
+@bp.route('/venues/<int:venue_id>')
+@replicas.reads
+@conditional(db.session, venue_validators)
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  body = {}
-  venue = db.session.query(Venue).filter(Venue.id == venue_id).first()
-  body["id"] = venue.id
-  body["name"] = venue.name
-  body["genres"] = venue.genres
-  body["address"] = venue.address
-  body["city"] = venue.city
-  body["state"] = venue.state
-  body["phone"] = venue.phone
-  body["website"] = venue.website_link
-  body["facebook_link"] = venue.facebook_link
-  body["seeking_talent"] = venue.seeking_talent
-  body["seeking_description"] = venue.seeking_description
-  body["image_link"] = venue.image_link
-  body["upcoming_shows"] = []
-  body["past_shows"] = []
-  
-  shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).all()
-  for show in shows:
-    if show.start_time.strftime('%Y-%m-%d %H:%M:%S') < current_time: 
-      body["past_shows"].append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artists.name,
-        "artist_image_link": show.artists.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-    else: 
-      body["upcoming_shows"].append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artists.name,
-        "artist_image_link": show.artists.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-      
-      
-  body["past_shows_count"] = len(body["past_shows"])
-  body["upcoming_shows_count"] = len(body["upcoming_shows"])
+  body = page_cache.get_or_set(venue_key(venue_id), lambda: venue_page(db.session, venue_id), page_expiry,
+                               store=not replicas.routed())
+  if body is None:
+    abort(404)
   return render_template('pages/show_venue.html', venue=body)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   error = False
   # TODO: insert form data as a new Venue record in the db, instead
@@ -188,9 +222,11 @@ def create_venue_submission():
     
 
     venue = Venue(name=name, city=city, state=state, address=address, phone=phone, image_link=image_link, genres=genres, facebook_link=facebook_link, website_link=website_link, seeking_talent=seeking_talent, seeking_description=seeking_description)
+    geocoding.place(venue, geocoding.places())
   # TODO: modify data to be the data object returned from db insertion
     db.session.add(venue)
     db.session.commit()
+    page_cache.invalidate([venue_key(venue.id)])
   except: 
     db.session.rollback()
     error = True
@@ -204,23 +240,27 @@ def create_venue_submission():
   else: 
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')  
-  return redirect(url_for('venues'))
+  return redirect(url_for('.venues'))
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  # A deleted venue is only marked as such (deleted_at): its past shows
+  # keep pointing at it, while its upcoming shows go, uncounted from their
+  # artists by one UPDATE and removed by one DELETE, never loaded.
   error = False
+  venue = find_venue(db.session, venue_id)
+  if venue is None:
+    abort(404)
   try: 
-    venue = db.session.query(Venue).filter(Venue.id == venue_id).first()
-    venue_shows = db.session.query(Show).filter(Show.venue_id == venue_id).all()
-    # Delete future events of this Venue
-    for show in venue_shows: 
-      if show.start_time.strftime('%Y-%m-%d %H:%M:%S') > current_time:
-        db.session.delete(show)
-    
-    db.session.delete(venue)
+    stale_keys = venue_page_keys(db.session, venue_id)
+    upcoming = (Show.venue_id == venue_id, is_upcoming())
+    show_counts.remove_matching(db.session, *upcoming)
+    show_calendar.remove_matching(db.session, *upcoming)
+    db.session.query(Show).filter(*upcoming).delete(synchronize_session=False)
+    venue.deleted_at = datetime.utcnow()
+    _warm_pages_later(stale_keys)
     db.session.commit()
+    page_cache.invalidate(stale_keys)
   except:
     db.session.rollback()
     error = True
@@ -234,94 +274,84 @@ def delete_venue(venue_id):
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  return redirect(url_for('index'))
+  return redirect(url_for('.index'))
 
 
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@replicas.reads
+@conditional(db.session, artists_validators)
 def artists():
   # TODO: replace with real data returned from querying the database
-  artists = db.session.query(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=artists)
+  genres = requested_genres()
+  artists = artist_directory(db.session, genres)
+  facets = facet_links(genre_counts(db.session, Artist, genres), genres)
+  return render_template('pages/artists.html', artists=artists, facets=facets)
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['GET', 'POST'])
+@replicas.reads
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  search_term = request.form['search_term']
-  artists_matching_search_term = db.session.query(Artist).filter(Artist.name.ilike('%' + search_term + '%')).all()
-  
-  response = {
-    "count": len(artists_matching_search_term),
-    "data": []
-  }
+  search_term = request.values.get('search_term', '')
+  genres = requested_genres()
+  artists_matching_search_term = find_artists(db.session, search_term, current_app.config['SEARCH_RESULTS_LIMIT'], genres)
   
-  for artist in artists_matching_search_term: 
-    upcoming_shows = []
-    shows = db.session.query(Show).filter(Show.artist_id == artist.id).all()
-    
-    for show in shows: 
-      if show.start_time.strftime('%Y-%m-%d %H:%M:%S') > current_time: 
-        upcoming_shows.append(show)
-    
-    response["data"].append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(upcoming_shows)
-    })
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
+  response = search_results(artists_matching_search_term)
+  facets = facet_links(search_genre_counts(db.session, Artist, search_term, genres), genres)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term, facets=facets)
+
+@bp.route('/artists/<int:artist_id>')
+@replicas.reads
+@conditional(db.session, artist_validators)
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  body = {}
-  artist = db.session.query(Artist).filter(Artist.id == artist_id).first()
-  body["id"] = artist.id
-  body["name"] = artist.name
-  body["genres"] = artist.genres
-  body["city"] = artist.city
-  body["state"] = artist.state
-  body["phone"] = artist.phone
-  body["website"] = artist.website_link
-  body["facebook_link"] = artist.facebook_link
-  body["seeking_venue"] = artist.seeking_venue
-  body["seeking_description"] = artist.seeking_description
-  body["image_link"] = artist.image_link
-  body["past_shows"] = []
-  body["upcoming_shows"] = []
-  
-  shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).all()
-  for show in shows: 
-    if show.start_time.strftime('%Y-%m-%d %H:%M:%S') > current_time:
-      body["upcoming_shows"].append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venues.name,
-        "venue_image_link": show.venues.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-    else: 
-      body["past_shows"].append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venues.name,
-        "venue_image_link": show.venues.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-      })
-  body["past_shows_count"] = len(body["past_shows"])
-  body["upcoming_shows_count"] = len(body["upcoming_shows"])
-  
+  body = page_cache.get_or_set(artist_key(artist_id), lambda: artist_page(db.session, artist_id), page_expiry,
+                               store=not replicas.routed())
+  if body is None:
+    abort(404)
   return render_template('pages/show_artist.html', artist=body)
 
+@bp.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  # Soft-deleted like venues, see delete_venue.
+  error = False
+  artist = find_artist(db.session, artist_id)
+  if artist is None:
+    abort(404)
+  try:
+    stale_keys = artist_page_keys(db.session, artist_id)
+    upcoming = (Show.artist_id == artist_id, is_upcoming())
+    show_counts.remove_matching(db.session, *upcoming)
+    show_calendar.remove_matching(db.session, *upcoming)
+    db.session.query(Show).filter(*upcoming).delete(synchronize_session=False)
+    artist.deleted_at = datetime.utcnow()
+    _warm_pages_later(stale_keys)
+    db.session.commit()
+    page_cache.invalidate(stale_keys)
+  except:
+    db.session.rollback()
+    error = True
+  finally:
+    db.session.close()
+  if error:
+    flash('Error!!! Artist not deleted, please try again.')
+  else:
+    flash('Artist deleted successfully!')
+  return redirect(url_for('.index'))
+
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm(request.form)
   
-  artist = db.session.query(Artist).filter(Artist.id == artist_id).first()
+  artist = find_artist(db.session, artist_id)
+  if artist is None:
+    abort(404)
   
   form.name.data = artist.name
   form.genres.data = artist.genres
@@ -337,13 +367,15 @@ def edit_artist(artist_id):
   # TODO: populate form with fields from artist with ID <artist_id>
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
   error = False
     
-  artist = db.session.query(Artist).filter(Artist.id == artist_id).first()
+  artist = find_artist(db.session, artist_id)
+  if artist is None:
+    abort(404)
   artist.name = request.form['name']
   artist.city = request.form['city']
   artist.state = request.form['state']
@@ -357,7 +389,10 @@ def edit_artist_submission(artist_id):
   
   
   try: 
+      stale_keys = artist_page_keys(db.session, artist_id)
+      _warm_pages_later(stale_keys)
       db.session.commit()
+      page_cache.invalidate(stale_keys)
   except: 
       db.session.rollback()
       error = True
@@ -369,14 +404,16 @@ def edit_artist_submission(artist_id):
   else: 
       flash('Artist ' + request.form['name'] + ' details updated successfully.')
   
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm(request.form)
   
-  venue = db.session.query(Venue).filter(Venue.id == venue_id).first()
+  venue = find_venue(db.session, venue_id)
+  if venue is None:
+    abort(404)
   form.name.data = venue.name
   form.city.data = venue.city
   form.state.data = venue.state
@@ -392,16 +429,21 @@ def edit_venue(venue_id):
   # TODO: populate form with values from venue with ID <venue_id>
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
   error = False
   
-  venue = db.session.query(Venue).filter(Venue.id == venue_id).first()
+  venue = find_venue(db.session, venue_id)
+  if venue is None:
+    abort(404)
+  moved = (venue.city, venue.state) != (request.form['city'], request.form['state'])
   venue.name = request.form['name']
   venue.city = request.form['city']
   venue.state = request.form['state']
+  if moved:
+    geocoding.place(venue, geocoding.places())
   venue.address = request.form['address']
   venue.phone = request.form['phone']
   venue.image_link = request.form['image_link']
@@ -412,7 +454,10 @@ def edit_venue_submission(venue_id):
   venue.seeking_description = request.form['seeking_description']
   
   try:
+    stale_keys = venue_page_keys(db.session, venue_id)
+    _warm_pages_later(stale_keys)
     db.session.commit()
+    page_cache.invalidate(stale_keys)
   except:
     db.session.rollback()
     error = True
@@ -424,17 +469,17 @@ def edit_venue_submission(venue_id):
   else: 
     flash('Venue ' + request.form['name'] + ' details updated successfully.')
   
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('.show_venue', venue_id=venue_id))
       
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
@@ -442,7 +487,7 @@ def create_artist_submission():
   
   # if int(request.form['phone']) < 100000:
   #   flash('Phone Number Field input must be digit')
-  #   return(redirect(url_for('create_artist_form')))
+  #   return(redirect(url_for('.create_artist_form')))
   
   error = False
   try: 
@@ -460,7 +505,11 @@ def create_artist_submission():
     artist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, facebook_link=facebook_link, image_link=image_link, website_link=website_link, seeking_venue=seeking_venue, seeking_description=seeking_description)
     
     db.session.add(artist)
+    db.session.flush()
+    # Read the id before commit, which would expire it and cost a reload.
+    stale_keys = [artist_key(artist.id)]
     db.session.commit()
+    page_cache.invalidate(stale_keys)
   except: 
     db.session.rollback()
     error = True
@@ -481,53 +530,81 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@replicas.reads
+@conditional(db.session, shows_validators)
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  returnVal = []
-  shows = db.session.query(Show).all()
-  for show in shows: 
-    artist = db.session.query(Artist).filter(Artist.id == show.artist_id).first()
-    venue = db.session.query(Venue).filter(Venue.id == show.venue_id).first()
-    returnVal.append({
-      "venue_id": show.venue_id,
-      "venue_name": venue.name, # or venue
-      "artist_id": show.artist_id,
-      "artist_name": artist.name,
-      "artist_image_link": artist.image_link,
-      "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-  
-  return render_template('pages/shows.html', shows=returnVal)
-
-@app.route('/shows/create')
+  # displays list of shows at /shows, one keyset page at a time, under the
+  # month calendar of the filtered shows
+  per_page = min(request.args.get('per_page', current_app.config['SHOWS_PER_PAGE'], type=int), current_app.config['SHOWS_MAX_PER_PAGE'])
+  try:
+    after = decode_cursor(request.args['after']) if 'after' in request.args else None
+    before = decode_cursor(request.args['before']) if 'before' in request.args else None
+  except ValueError:
+    after = before = None
+  try:
+    filters = requested_show_filters()
+    month = requested_month(filters, current_time())
+  except ValueError as e:
+    abort(400, str(e))
+  page = show_listing(db.session, max(per_page, 1), after=after, before=before, criteria=filters.criteria(db.session))
+  weeks = month_calendar(db.session, month, filters)
+
+  # The shows.html tiles are cached under these rows' updated_at stamps.
+  return render_template('pages/shows.html', shows=page["shows"], next_cursor=page["next"], prev_cursor=page["prev"], per_page=request.args.get('per_page', type=int),
+                         filters=filters, month=month, weeks=weeks, prev_month=add_months(month, -1), next_month=add_months(month, 1))
+
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
   # artist_id, venue_id, start_time
   error = False
+  conflict = None
   try: 
-    artist_id = request.form['artist_id']
-    venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
-    
-    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+    artist_id = int(request.form['artist_id'])
+    venue_id = int(request.form['venue_id'])
+    start_time = dateutil.parser.parse(request.form['start_time'])
+    duration = timedelta(minutes=int(request.form['duration'])) if request.form.get('duration') else DEFAULT_SHOW_DURATION
+    if not timedelta(0) < duration <= MAX_SHOW_DURATION:
+      raise ValueError('duration out of range')
+    end_time = start_time + duration
+    if find_venue(db.session, venue_id) is None or find_artist(db.session, artist_id) is None:
+      raise ValueError('no such venue or artist')
+
+    # One indexed range read per side; Postgres' exclusion constraints
+    # catch a concurrent booking that slips in after it.
+    bookings.check_available(db.session, venue_id, artist_id, start_time, end_time)
+    show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
     db.session.add(show)
+    # Counting the show also bumps the venue's and artist's updated_at.
+    show_counts.add_shows(db.session, [(venue_id, artist_id, start_time)])
+    show_calendar.add_shows(db.session, [(venue_id, artist_id, start_time)])
+    stale_keys = [venue_key(venue_id), artist_key(artist_id)]
+    _warm_pages_later(stale_keys)
     db.session.commit()
-  except: 
+    page_cache.invalidate(stale_keys)
+  except bookings.BookingConflict as e:
     db.session.rollback()
-    error = True
-    print(sys.exc_info())
+    conflict = str(e)
+  except Exception as e:
+    db.session.rollback()
+    if bookings.is_conflict_error(e):
+      conflict = 'The venue or the artist was booked for that time in the meantime'
+    else:
+      error = True
+      print(sys.exc_info())
   finally: 
     db.session.close()
-  if error: 
+  if conflict:
+    flash('Show could not be listed. ' + conflict + '.')
+  elif error: 
      # TODO: on unsuccessful db insert, flash an error instead.
     # e.g., flash('An error occurred. Show could not be listed.')
     flash('An error occurred. Show could not be listed.')
@@ -542,36 +619,255 @@ def create_show_submission():
  
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  Import and export
+#  ----------------------------------------------------------------
+
+def has_bearer_token(setting):
+  # endpoints guarded by a token setting don't exist while it is unset
+  token = current_app.config[setting]
+  if not token:
+    abort(404)
+  supplied = request.headers.get('Authorization', '')
+  return hmac.compare_digest(supplied.encode(), ('Bearer ' + token).encode())
+
+@bp.route('/import/<kind>', methods=['POST'])
+def import_upload(kind):
+  # bulk import of an uploaded CSV/NDJSON file, see importer.py
+  if not has_bearer_token('IMPORT_API_TOKEN'):
+    return jsonify({"error": "a valid bearer token is required"}), 401
+  if kind not in KINDS:
+    abort(404)
+
+  upload = request.files.get('file')
+  stream = upload.stream if upload else request.stream
+  format = request.args.get('format') or detect_format(upload.filename if upload else None, request.content_type)
+  if format not in FORMATS:
+    return jsonify({"error": "format must be one of " + ', '.join(FORMATS)}), 400
+  report = import_records(db.session, kind, stream, format,
+                          batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                          max_errors=current_app.config['IMPORT_MAX_ERRORS'],
+                          invalidate=page_cache.invalidate)
+  db.session.close()
+  return jsonify(report.to_dict())
+
+@bp.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', type=click.Choice(FORMATS), help='default: from the file extension')
+@click.option('--batch-size', type=int, help='rows per INSERT, default IMPORT_BATCH_SIZE')
+def import_command(kind, file, format, batch_size):
+  """Import venues, artists or shows from a CSV or NDJSON FILE ('-' for stdin)."""
+  report = import_records(db.session, kind, file, format or detect_format(file.name),
+                          batch_size=batch_size or current_app.config['IMPORT_BATCH_SIZE'],
+                          max_errors=current_app.config['IMPORT_MAX_ERRORS'],
+                          invalidate=page_cache.invalidate)
+  db.session.close()
+  for error in report.errors:
+    click.echo('line %d: %s' % (error["line"], json.dumps(error["errors"])), err=True)
+  if report.failed > len(report.errors):
+    click.echo('... %d more' % (report.failed - len(report.errors)), err=True)
+  click.echo('%d %s imported, %d rejected' % (report.inserted, kind, report.failed))
+  if report.failed:
+    sys.exit(1)
+
+@bp.route('/export/<kind>')
+def export_download(kind):
+  # streams a whole table, or the rows changed since ?since=, see exporter.py
+  if not has_bearer_token('EXPORT_API_TOKEN'):
+    return jsonify({"error": "a valid bearer token is required"}), 401
+  if kind not in exporter.MODELS:
+    abort(404)
+  format = request.args.get('format', 'csv')
+  try:
+    since = exporter.parse_since(request.args['since']) if 'since' in request.args else None
+    chunks = exporter.export(db.session, kind, format, since, current_app.config['EXPORT_CHUNK_SIZE'])
+  except ValueError as e:
+    return jsonify({"error": str(e)}), 400
+  return Response(stream_with_context(chunks), mimetype=exporter.MIMETYPES[format], headers={
+    'Content-Disposition': 'attachment; filename=%s.%s' % (kind, format),
+    'Cache-Control': 'no-store'
+  })
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(exporter.MODELS)))
+@click.option('--format', type=click.Choice(exporter.FORMATS), default='csv')
+@click.option('--since', help='only rows written at or after this UTC timestamp (ISO 8601)')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='default: stdout')
+def export_command(kind, format, since, output):
+  """Stream venues, artists or shows to a CSV, NDJSON or Parquet file."""
+  try:
+    since = exporter.parse_since(since) if since else None
+  except ValueError as e:
+    raise click.BadParameter(str(e), param_hint='--since')
+  progress = exporter.ExportProgress()
+  for chunk in exporter.export(db.session, kind, format, since, current_app.config['EXPORT_CHUNK_SIZE'], progress):
+    output.write(chunk)
+  output.flush()
+  db.session.close()
+  # the watermark is the --since of the next incremental run
+  click.echo('%d %s exported, watermark %s' % (
+    progress.rows, kind, progress.watermark.isoformat() if progress.watermark else since and since.isoformat()), err=True)
+
+#  Show counters
+#  ----------------------------------------------------------------
+
+@bp.cli.group('show-counts')
+def show_counts_command():
+  """Maintain the venue and artist show counters."""
+
+@show_counts_command.command('rollover')
+def show_counts_rollover():
+  """Move shows that have started from upcoming to past (run every minute)."""
+  moved = show_counts.rollover(db.session)
+  click.echo('%d shows moved to past' % moved)
+
+@show_counts_command.command('rebuild')
+def show_counts_rebuild():
+  """Recount every venue and artist from the shows table."""
+  show_counts.rebuild(db.session)
+  click.echo('show counters rebuilt')
+
+@bp.cli.group('show-calendar')
+def show_calendar_command():
+  """Maintain the per-day show counts of the shows calendar."""
+
+@show_calendar_command.command('rebuild')
+def show_calendar_rebuild():
+  """Recount every venue's shows per day from the shows table."""
+  show_calendar.rebuild(db.session)
+  click.echo('show calendar rebuilt')
+
+#  Geocoding
+#  ----------------------------------------------------------------
+
+@bp.cli.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Place every venue again, not only those without coordinates.')
+@click.option('--batch-size', default=1000, show_default=True)
+def geocode_command(everything, batch_size):
+  """Place venues at their city's coordinates from the local lookup table."""
+  places = geocoding.places()
+  placed, unknown = geocoding.geocode_venues(db.session, places, batch_size=batch_size, everything=everything)
+  click.echo('%d venues placed from %d known places' % (placed, len(places)))
+  for (city, state), count in sorted(unknown.items(), key=lambda item: -item[1]):
+    click.echo('unknown place: %s, %s (%d venues)' % (city, state, count), err=True)
+
+#  Jobs
+#  ----------------------------------------------------------------
+
+@jobs.task('show-counts-rollover')
+def rollover_job():
+  show_counts.rollover(db.session)
+
+# Detail page builders by page cache key prefix (see cache.venue_key).
+PAGE_BUILDERS = {'venue': venue_page, 'artist': artist_page}
+
+@jobs.task('warm-pages')
+def warm_pages_job(keys):
+  # Rebuilds the detail pages a write invalidated, so their next visitor
+  # gets a cached page.
+  for key in keys:
+    kind, id = key.split(':')
+    page_cache.get_or_set(key, lambda: PAGE_BUILDERS[kind](db.session, int(id)), page_expiry)
+
+def _warm_pages_later(keys):
+  # In the caller's transaction. Only a cache every process shares is worth
+  # warming from a job; an in-process one would warm just the worker's.
+  if page_cache.shared:
+    jobs.enqueue(db.session, 'warm-pages', {'keys': keys})
+
+@bp.cli.group('jobs')
+def jobs_command():
+  """Run and inspect background jobs."""
+
+@jobs_command.command('work')
+@click.option('--workers', type=int, help='worker threads, default JOBS_WORKERS')
+def jobs_work(workers):
+  """Run jobs and the job schedule until interrupted."""
+  app = current_app._get_current_object()
+  jobs.start(app, workers=workers or app.config['JOBS_WORKERS'] or 1)
+  click.echo('working, ^C to stop')
+  # Process managers stop workers with SIGTERM; let the running jobs finish.
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    jobs.stop(app)
+    click.echo('stopped')
+
+@jobs_command.command('run-pending')
+def jobs_run_pending():
+  """Enqueue the scheduled jobs that are due, run every due job, and exit."""
+  jobs.tick()
+  click.echo('%d jobs run' % jobs.run_pending())
+
+@jobs_command.command('status')
+def jobs_status():
+  """Show how many jobs are in each state, and the last failures."""
+  stats = jobs.stats()
+  for state in ('queued', 'running', 'done', 'failed'):
+    click.echo('%-8s %d' % (state, stats["queue"].get(state, 0)))
+  click.echo('oldest due job waiting %.0fs' % stats["lag_seconds"])
+  failed = db.session.query(Job).filter(Job.state == 'failed').order_by(Job.finished_at.desc()).limit(5)
+  for job in failed:
+    click.echo('\n#%d %s (%d attempts), %s:\n%s' % (job.id, job.task, job.attempts, job.finished_at, job.last_error))
+
+#  Templates
+#  ----------------------------------------------------------------
+
+@bp.cli.command('compile-templates')
+def compile_templates_command():
+  """Compile every template into the bytecode cache, so workers start warm."""
+  click.echo('%d templates compiled' % templating.compile_all())
+
+#  Internal
+#  ----------------------------------------------------------------
+
+def _internal_allowed():
+  token = current_app.config['INTERNAL_METRICS_TOKEN']
+  if token:
+    supplied = request.headers.get('Authorization', '')
+    return hmac.compare_digest(supplied.encode(), ('Bearer ' + token).encode())
+  # without a token, only local clients reaching the app directly: behind a
+  # reverse proxy on the same host every request comes from loopback, and
+  # proxies say so with a forwarding header
+  forwarded = 'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers
+  return not forwarded and request.remote_addr in current_app.config['INTERNAL_ALLOWED_ADDRS']
+
+@bp.route('/internal/metrics')
+def internal_metrics():
+  if not _internal_allowed():
+    abort(404)
+  return jsonify({
+    "db_pool": pool_status(db.engine),
+    "page_cache": page_cache.stats(),
+    "fragment_cache": templating.stats(),
+    "jobs": jobs.stats(),
+    "replicas": replicas.stats()
+  })
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
-
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
+# `flask run` and `gunicorn 'app:create_app()'` build the app themselves.
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,155 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+from functools import wraps
+
+from flask import current_app, has_request_context, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from db_pool import database_key
+
+#----------------------------------------------------------------------------#
+# Async database access.
+#
+# Async views run on one event loop per worker process, in a background
+# thread, rather than on the fresh loop per request Flask uses by default:
+# pooled asyncpg connections belong to the loop that opened them, so only a
+# long-lived loop lets requests share a pool. A request thread hands its
+# view to the loop, with its context (request, g) carried over, and blocks
+# until it returns; while one view waits on the database the loop runs the
+# others, so a worker with many threads holds no more connections than the
+# async pool allows. Queries are the sync ones from queries.py, run through
+# AsyncSession.run_sync.
+#----------------------------------------------------------------------------#
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """`url` with its database's asyncio driver, e.g. postgresql+asyncpg://."""
+    url = make_url(url)
+    if url.get_driver_name() in ('asyncpg', 'aiosqlite'):
+        return url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('no asyncio driver known for %s, set ASYNC_DATABASE_URI' % backend)
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(config, url):
+    """create_async_engine() arguments from the DATABASE_POOL_* settings."""
+    if url.get_backend_name() != 'postgresql':
+        return {}
+    options = {
+        "pool_size": config['DATABASE_POOL_SIZE'],
+        "max_overflow": config['DATABASE_MAX_OVERFLOW'],
+        "pool_timeout": config['DATABASE_POOL_TIMEOUT'],
+        "pool_recycle": config['DATABASE_POOL_RECYCLE'],
+        "pool_pre_ping": config['DATABASE_POOL_PRE_PING']
+    }
+    if config['DATABASE_STATEMENT_TIMEOUT']:
+        options["connect_args"] = {
+            "server_settings": {"statement_timeout": str(config['DATABASE_STATEMENT_TIMEOUT'])}
+        }
+    return options
+
+
+def _settle(outcome, task):
+    if task.cancelled():
+        outcome.cancel()
+    elif task.exception() is not None:
+        outcome.set_exception(task.exception())
+    else:
+        outcome.set_result(task.result())
+
+
+class _EventLoopThread(object):
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='fyyur-async-db', daemon=True).start()
+
+    def run(self, coroutine):
+        """Run `coroutine` on the loop in the caller's context and wait for it."""
+        context = contextvars.copy_context()
+        outcome = concurrent.futures.Future()
+
+        def start():
+            task = context.run(self.loop.create_task, coroutine)
+            task.add_done_callback(lambda task: _settle(outcome, task))
+
+        self.loop.call_soon_threadsafe(start)
+        return outcome.result()
+
+
+class _AsyncDatabaseState(object):
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._loop = None
+        self._engine = None
+
+    def current(self):
+        # Threads do not survive a fork, so a forked worker starts its own
+        # loop and engine on first use.
+        with self._lock:
+            if self._loop is None or self._loop.pid != os.getpid():
+                url = async_url(self.config.get('ASYNC_DATABASE_URI') or self.config['SQLALCHEMY_DATABASE_URI'])
+                self._loop = _EventLoopThread()
+                self._engine = create_async_engine(url, **async_engine_options(self.config, url))
+            return self._loop, self._engine
+
+    def async_to_sync(self, func):
+        @wraps(func)
+        def run(*args, **kwargs):
+            if has_request_context():
+                # Read the body in the request's own thread, so the loop
+                # never waits on a client socket.
+                request.get_data(parse_form_data=True)
+            loop = self.current()[0]
+            return loop.run(func(*args, **kwargs))
+        return run
+
+
+class AsyncDatabase(object):
+    """Flask extension running the application's async views on a shared
+    event loop, next to an async engine for them to query.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        state = _AsyncDatabaseState(app.config)
+        app.extensions['async_db'] = state
+        # Flask.ensure_sync() calls this for every async view function.
+        app.async_to_sync = state.async_to_sync
+
+    @property
+    def engine(self):
+        return current_app.extensions['async_db'].current()[1]
+
+    def on_primary(self):
+        """Whether the async engine reads the primary database rather than
+        a replica ASYNC_DATABASE_URL names."""
+        return database_key(self.engine.url) == database_key(make_url(current_app.config['SQLALCHEMY_DATABASE_URI']))
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """Call `fn(session, *args, **kwargs)` with a sync Session over an
+        async connection of its own, so that several can run concurrently.
+        """
+        async with AsyncSession(self.engine) as session:
+            return await session.run_sync(fn, *args, **kwargs)
+
+
+# The application's async database; async_views.init_app() binds it.
+async_db = AsyncDatabase()
@@ -0,0 +1,148 @@
+import asyncio
+
+from flask import abort, current_app, render_template, request
+
+from async_db import async_db
+from cache import page_cache, venue_key, artist_key
+from http_cache import async_conditional, venues_validators, artists_validators, shows_validators, venue_validators, artist_validators
+from facets import requested_genres, genre_counts, facet_links
+from models import Venue, Artist
+from queries import (current_time, venue_directory, artist_directory, find_venue, venue_shows, build_venue_page, find_artist,
+                     artist_shows, build_artist_page, show_listing, decode_cursor, page_expiry)
+from search import find_venues, find_artists, search_results, search_genre_counts
+from show_calendar import requested_show_filters, requested_month, month_calendar, add_months
+
+#----------------------------------------------------------------------------#
+# Async read path.
+#
+# With ASYNC_READS, create_app() swaps these in for the read-only views of
+# the main blueprint: same URLs, endpoints, templates and queries, but each
+# database round trip is awaited on async_db's shared loop instead of
+# holding the worker thread's connection, and a detail page reads its row
+# and its shows over two connections at once. Everything that writes stays
+# synchronous.
+#----------------------------------------------------------------------------#
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@async_conditional(async_db, venues_validators)
+async def venues():
+    genres = requested_genres()
+    areas, counts = await asyncio.gather(
+        async_db.run_sync(venue_directory, genres),
+        async_db.run_sync(genre_counts, Venue, genres))
+    return render_template('pages/venues.html', areas=areas, facets=facet_links(counts, genres))
+
+
+async def search_venues():
+    search_term = request.values.get('search_term', '')
+    genres = requested_genres()
+    venues_matching_search_term, counts = await asyncio.gather(
+        async_db.run_sync(find_venues, search_term, current_app.config['SEARCH_RESULTS_LIMIT'], genres),
+        async_db.run_sync(search_genre_counts, Venue, search_term, genres))
+    response = search_results(venues_matching_search_term)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term,
+                           facets=facet_links(counts, genres))
+
+
+async def _venue_page(venue_id):
+    now = current_time()
+    venue, (upcoming_shows, past_shows) = await asyncio.gather(
+        async_db.run_sync(find_venue, venue_id),
+        async_db.run_sync(venue_shows, venue_id, now))
+    if venue is None:
+        return None
+    return build_venue_page(venue, upcoming_shows, past_shows)
+
+
+@async_conditional(async_db, venue_validators)
+async def show_venue(venue_id):
+    body = await page_cache.get_or_set_async(venue_key(venue_id), lambda: _venue_page(venue_id), page_expiry,
+                                             store=async_db.on_primary())
+    if body is None:
+        abort(404)
+    return render_template('pages/show_venue.html', venue=body)
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@async_conditional(async_db, artists_validators)
+async def artists():
+    genres = requested_genres()
+    artists, counts = await asyncio.gather(
+        async_db.run_sync(artist_directory, genres),
+        async_db.run_sync(genre_counts, Artist, genres))
+    return render_template('pages/artists.html', artists=artists, facets=facet_links(counts, genres))
+
+
+async def search_artists():
+    search_term = request.values.get('search_term', '')
+    genres = requested_genres()
+    artists_matching_search_term, counts = await asyncio.gather(
+        async_db.run_sync(find_artists, search_term, current_app.config['SEARCH_RESULTS_LIMIT'], genres),
+        async_db.run_sync(search_genre_counts, Artist, search_term, genres))
+    response = search_results(artists_matching_search_term)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term,
+                           facets=facet_links(counts, genres))
+
+
+async def _artist_page(artist_id):
+    now = current_time()
+    artist, (upcoming_shows, past_shows) = await asyncio.gather(
+        async_db.run_sync(find_artist, artist_id),
+        async_db.run_sync(artist_shows, artist_id, now))
+    if artist is None:
+        return None
+    return build_artist_page(artist, upcoming_shows, past_shows)
+
+
+@async_conditional(async_db, artist_validators)
+async def show_artist(artist_id):
+    body = await page_cache.get_or_set_async(artist_key(artist_id), lambda: _artist_page(artist_id), page_expiry,
+                                             store=async_db.on_primary())
+    if body is None:
+        abort(404)
+    return render_template('pages/show_artist.html', artist=body)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@async_conditional(async_db, shows_validators)
+async def shows():
+    per_page = min(request.args.get('per_page', current_app.config['SHOWS_PER_PAGE'], type=int), current_app.config['SHOWS_MAX_PER_PAGE'])
+    try:
+        after = decode_cursor(request.args['after']) if 'after' in request.args else None
+        before = decode_cursor(request.args['before']) if 'before' in request.args else None
+    except ValueError:
+        after = before = None
+    try:
+        filters = requested_show_filters()
+        month = requested_month(filters, current_time())
+    except ValueError as e:
+        abort(400, str(e))
+    page, weeks = await asyncio.gather(
+        async_db.run_sync(lambda session: show_listing(session, max(per_page, 1), after=after, before=before,
+                                                       criteria=filters.criteria(session))),
+        async_db.run_sync(month_calendar, month, filters))
+    return render_template('pages/shows.html', shows=page["shows"], next_cursor=page["next"], prev_cursor=page["prev"],
+                           per_page=request.args.get('per_page', type=int), filters=filters, month=month, weeks=weeks,
+                           prev_month=add_months(month, -1), next_month=add_months(month, 1))
+
+
+# Endpoint of each main blueprint view and its async replacement.
+VIEWS = {
+    'main.venues': venues,
+    'main.search_venues': search_venues,
+    'main.show_venue': show_venue,
+    'main.artists': artists,
+    'main.search_artists': search_artists,
+    'main.show_artist': show_artist,
+    'main.shows': shows,
+}
+
+
+def init_app(app):
+    """Serve the read-only pages of `app` with the async views above."""
+    async_db.init_app(app)
+    app.view_functions.update(VIEWS)
@@ -0,0 +1,8 @@
+"""Performance benchmarks for Fyyur.
+
+Run them from the project root, e.g. ``python -m benchmarks.venue_directory``.
+``benchmarks.datagen`` fills a database with synthetic data at any scale and
+``benchmarks.workload`` replays a mixed read/write workload against every
+route, comparing against ``benchmarks/baseline.json``; ``fab test`` runs the
+checks.
+"""
@@ -0,0 +1,115 @@
+"""Compare concurrent read throughput of the sync views and the async read path.
+
+    python -m benchmarks.async_reads
+    python -m benchmarks.async_reads --database-url postgresql://localhost/fyyur_bench --concurrency 8 32 64
+
+The same read-only mix (listings, detail pages, search, /shows) is replayed
+against two applications on one database, the default one and one with
+ASYNC_READS, by `--concurrency` threads at a time: each thread is a request
+in flight, as in a threaded gunicorn worker. The page cache is off so every
+detail page reaches the database. Prints requests per second and p50/p95
+latency for each mode and level of concurrency.
+
+The difference comes from waiting on the database, so SQLite on local disk
+mostly measures the async machinery's overhead; point --database-url at a
+networked Postgres to see the gain. Without it the run uses a throwaway
+SQLite file filled by benchmarks.datagen.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+
+from app import create_app
+from benchmarks.datagen import generate
+from benchmarks.workload import (Dataset, percentile, venue_list, venue_search, venue_detail, artist_list,
+                                 artist_search, artist_detail, show_list, show_list_page)
+from models import db, Venue, Artist
+
+TASKS = [
+    (2, venue_list),
+    (2, venue_search),
+    (6, venue_detail),
+    (2, artist_list),
+    (2, artist_search),
+    (6, artist_detail),
+    (3, show_list),
+    (2, show_list_page),
+]
+
+
+def client_thread(app, data, seed, num_requests, latencies, errors):
+    rng = random.Random(seed)
+    weights = [weight for weight, task in TASKS]
+    client = app.test_client()
+    for _ in range(num_requests):
+        weight, task = rng.choices(TASKS, weights=weights)[0]
+        method, path, form = task(rng, data)
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors.append(path)
+
+
+def measure(app, data, concurrency, num_requests, seed):
+    latencies, errors = [], []
+    per_thread = max(num_requests // concurrency, 1)
+    threads = [threading.Thread(target=client_thread, args=(app, data, seed + i, per_thread, latencies, errors))
+               for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / duration, percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--generate', type=int, metavar='SHOWS',
+                        help='recreate the tables with this many synthetic shows first (default 10000 on the throwaway database)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=800, help='requests per mode and concurrency level')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    database_url, generate_shows = args.database_url, args.generate
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'async_reads.db')
+        generate_shows = generate_shows or 10000
+
+    apps = {}
+    for mode in ('sync', 'async'):
+        apps[mode] = create_app({
+            'SQLALCHEMY_DATABASE_URI': database_url,
+            'TESTING': True,
+            'CACHE_TTL': 0,
+            'ASYNC_READS': mode == 'async'
+        })
+
+    with apps['sync'].app_context():
+        if generate_shows:
+            generate(db.get_engine(), generate_shows, seed=args.seed)
+        data = Dataset(db.session.query(func.max(Venue.id)).scalar() or 0,
+                       db.session.query(func.max(Artist.id)).scalar() or 0)
+        db.session.remove()
+
+    print('%-6s %12s %10s %10s %10s %7s' % ('mode', 'concurrency', 'req/s', 'p50 ms', 'p95 ms', 'errors'))
+    for concurrency in args.concurrency:
+        for mode in ('sync', 'async'):
+            # A short warm-up fills the pools and compiles the templates.
+            measure(apps[mode], data, concurrency, concurrency * 2, args.seed)
+            rps, p50, p95, errors = measure(apps[mode], data, concurrency, args.requests, args.seed)
+            print('%-6s %12d %10.1f %10.1f %10.1f %7d' % (mode, concurrency, rps, p50, p95, errors))
+
+
+if __name__ == '__main__':
+    main()
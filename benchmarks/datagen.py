@@ -0,0 +1,276 @@
+"""Fill a database with a realistic synthetic Fyyur dataset.
+
+    python -m benchmarks.datagen --shows 1000000 --database-url postgresql://localhost/fyyur_bench
+    python -m benchmarks.datagen --shows 10000                  # into ./fyyur_bench.db
+
+Venues and artists get plausible names, cities, genres and links, and
+venues their city's coordinates; a few cities and a few popular venues and
+artists account for most shows, and shows fall on evenings spread over the
+year either side of now, never double-booking a venue or an artist. Rows
+are generated and written in chunks, so 10M shows need no more memory than
+1k: Postgres is loaded with COPY, any other database with executemany().
+
+The target tables are dropped and recreated, never point this at real data.
+"""
+import argparse
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import config
+from forms import VenueForm
+from geocoding import Places, geocode_venues
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_DURATION
+import show_calendar
+import show_counts
+
+CHUNK_SIZE = 10000
+
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+
+# Ordered from the busiest city down; see _zipf_weights().
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Nashville', 'TN'),
+    ('Austin', 'TX'), ('San Francisco', 'CA'), ('Seattle', 'WA'), ('New Orleans', 'LA'),
+    ('Atlanta', 'GA'), ('Denver', 'CO'), ('Boston', 'MA'), ('Philadelphia', 'PA'),
+    ('Portland', 'OR'), ('Detroit', 'MI'), ('Minneapolis', 'MN'), ('Miami', 'FL'),
+    ('Memphis', 'TN'), ('Kansas City', 'MO'), ('Phoenix', 'AZ'), ('Las Vegas', 'NV'),
+    ('Columbus', 'OH'), ('Baltimore', 'MD'), ('Salt Lake City', 'UT'), ('Albuquerque', 'NM')
+]
+
+ADJECTIVES = [
+    'Velvet', 'Blue', 'Golden', 'Electric', 'Rusty', 'Midnight', 'Crimson', 'Silver',
+    'Wild', 'Lonesome', 'Neon', 'Hollow', 'Brass', 'Copper', 'Painted', 'Broken',
+    'Little', 'Grand', 'Royal', 'Secret', 'Lucky', 'Howling', 'Quiet', 'Musical'
+]
+VENUE_NOUNS = [
+    'Room', 'Hall', 'Lounge', 'Tavern', 'Ballroom', 'Theatre', 'Cellar', 'Garden',
+    'Saloon', 'Club', 'Hop', 'Loft', 'Warehouse', 'Pavilion', 'Station', 'Coffee House'
+]
+ARTIST_NOUNS = [
+    'Petals', 'Wolves', 'Sax Band', 'Strings', 'Echoes', 'Riders', 'Sisters', 'Kings',
+    'Choir', 'Collective', 'Brothers', 'Orchestra', 'Ramblers', 'Horns', 'Hearts', 'Trio'
+]
+FIRST_NAMES = ['Matt', 'Ana', 'Jules', 'Priya', 'Marcus', 'Lena', 'Theo', 'Rosa', 'Kofi', 'Mei']
+LAST_NAMES = ['Quevado', 'Okafor', 'Lindqvist', 'Moreau', 'Haddad', 'Nakamura', 'Reyes', 'Brennan']
+STREETS = ['Main St', 'Market St', 'Broadway', 'Elm Ave', 'Union Sq', 'Harbor Blvd', 'Mill Rd', 'Canal St']
+
+
+def default_counts(num_shows):
+    """Venue and artist counts that keep Fyyur's proportions at any scale."""
+    return max(num_shows // 200, 10), max(num_shows // 50, 10)
+
+
+def _zipf_weights(n, s=1.0):
+    """Cumulative weights where item k is picked about 1/k^s as often as item 1."""
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def _slug(name):
+    return ''.join(c for c in name.lower() if c.isalnum())
+
+
+def _genres(rng):
+    return rng.sample(GENRES, rng.choice((1, 1, 2, 2, 3)))
+
+
+def venue_rows(rng, num_venues, now):
+    city_weights = _zipf_weights(len(CITIES))
+    for venue_id in range(1, num_venues + 1):
+        city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+        name = 'The %s %s' % (rng.choice(ADJECTIVES), rng.choice(VENUE_NOUNS))
+        seeking_talent = rng.random() < 0.3
+        yield {
+            "id": venue_id,
+            "name": name,
+            "city": city,
+            "state": state,
+            "address": '%d %s' % (rng.randint(1, 9999), rng.choice(STREETS)),
+            "phone": '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            "image_link": 'https://images.example.com/venues/%d.jpg' % venue_id,
+            "facebook_link": 'https://www.facebook.com/%s%d' % (_slug(name), venue_id),
+            "genres": _genres(rng),
+            "website_link": 'https://www.%s%d.com' % (_slug(name), venue_id),
+            "seeking_talent": seeking_talent,
+            "seeking_description": 'We are on the lookout for a local artist to play every two weeks.' if seeking_talent else None,
+            "updated_at": now
+        }
+
+
+def artist_rows(rng, num_artists, now):
+    city_weights = _zipf_weights(len(CITIES))
+    for artist_id in range(1, num_artists + 1):
+        city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+        if rng.random() < 0.4:
+            name = '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        else:
+            name = 'The %s %s' % (rng.choice(ADJECTIVES), rng.choice(ARTIST_NOUNS))
+        seeking_venue = rng.random() < 0.4
+        yield {
+            "id": artist_id,
+            "name": name,
+            "city": city,
+            "state": state,
+            "phone": '%03d-%03d-%04d' % (rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            "genres": _genres(rng),
+            "image_link": 'https://images.example.com/artists/%d.jpg' % artist_id,
+            "facebook_link": 'https://www.facebook.com/%s%d' % (_slug(name), artist_id),
+            "website_link": 'https://www.%s%d.com' % (_slug(name), artist_id),
+            "seeking_venue": seeking_venue,
+            "seeking_description": 'Looking for shows to perform at in the area!' if seeking_venue else None,
+            "updated_at": now
+        }
+
+
+# Each evening has three booking windows; a show starts in the first half
+# hour of one and, at DEFAULT_SHOW_DURATION, ends before the next opens.
+WINDOWS = [timedelta(hours=18), timedelta(hours=20, minutes=30), timedelta(hours=23)]
+DAYS = range(-365, 366)
+
+
+def _distinct(rng, ids, cum_weights, k):
+    """k different ids drawn by weight."""
+    picked, seen = [], set()
+    while len(picked) < k:
+        for id in rng.choices(ids, cum_weights=cum_weights, k=k - len(picked)):
+            if id not in seen:
+                seen.add(id)
+                picked.append(id)
+    return picked
+
+
+def show_rows(rng, num_shows, num_venues, num_artists, now):
+    # Bookings never overlap, as the exclusion constraints on shows require:
+    # shows are spread evenly over the windows, and the shows of a window
+    # go to different venues and different artists.
+    venue_ids, venue_weights = range(1, num_venues + 1), _zipf_weights(num_venues, 0.8)
+    artist_ids, artist_weights = range(1, num_artists + 1), _zipf_weights(num_artists, 0.8)
+    windows = [(day, window) for day in DAYS for window in WINDOWS]
+    busiest = -(-num_shows // len(windows))
+    if busiest > min(num_venues, num_artists):
+        raise ValueError('%d shows need at least %d venues and %d artists, or some would be double-booked'
+                         % (num_shows, busiest, busiest))
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    updated_at = datetime.utcnow()
+    show_id = 0
+    for index, (day, window) in enumerate(windows):
+        size = num_shows * (index + 1) // len(windows) - num_shows * index // len(windows)
+        venues = _distinct(rng, venue_ids, venue_weights, size)
+        artists = _distinct(rng, artist_ids, artist_weights, size)
+        for venue_id, artist_id in zip(venues, artists):
+            start_time = midnight + timedelta(days=day, minutes=30 * rng.randint(0, 1)) + window
+            show_id += 1
+            yield {
+                "id": show_id,
+                "artist_id": artist_id,
+                "venue_id": venue_id,
+                "start_time": start_time,
+                "end_time": start_time + DEFAULT_SHOW_DURATION,
+                "updated_at": updated_at
+            }
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return '{%s}' % ','.join('"%s"' % item for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return value
+
+
+def _copy(engine, table, rows):
+    """Stream `rows` into `table` with COPY ... FROM STDIN (psycopg2 only)."""
+    columns = [column.name for column in table.columns]
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for chunk in _chunks(rows):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in chunk:
+                # An unquoted empty field is NULL in COPY's CSV format.
+                writer.writerow(['' if row.get(name) is None else _copy_value(row[name]) for name in columns])
+            buffer.seek(0)
+            cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table.name, ', '.join(columns)), buffer)
+        cursor.execute("SELECT setval(pg_get_serial_sequence('%s', 'id'), (SELECT coalesce(max(id), 1) FROM %s))" % (table.name, table.name))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _executemany(engine, table, rows):
+    with engine.begin() as conn:
+        for chunk in _chunks(rows):
+            conn.execute(table.insert(), chunk)
+
+
+def generate(engine, num_shows, num_venues=None, num_artists=None, seed=0):
+    """Recreate the schema on `engine` and load a synthetic dataset into it.
+
+    Returns the number of venues, artists and shows written.
+    """
+    default_venues, default_artists = default_counts(num_shows)
+    num_venues = num_venues or default_venues
+    num_artists = num_artists or default_artists
+
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS earthdistance CASCADE')
+            conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+
+    use_copy = engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg2'
+    write = _copy if use_copy else _executemany
+    rng = random.Random(seed)
+    now = datetime.now()
+    write(engine, Venue.__table__, venue_rows(rng, num_venues, datetime.utcnow()))
+    write(engine, Artist.__table__, artist_rows(rng, num_artists, datetime.utcnow()))
+    write(engine, Show.__table__, show_rows(rng, num_shows, num_venues, num_artists, now))
+    with Session(engine) as session:
+        show_counts.rebuild(session, now)
+        show_calendar.rebuild(session)
+        geocode_venues(session, Places.from_csv(config.GEOCODING_PLACES_FILE))
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE venues, artists, shows, show_days')
+    return num_venues, num_artists, num_shows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:///fyyur_bench.db')
+    parser.add_argument('--shows', type=int, default=10000, help='1k to 10M is the supported range')
+    parser.add_argument('--venues', type=int, help='default: one per 200 shows')
+    parser.add_argument('--artists', type=int, help='default: one per 50 shows')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    venues, artists, shows = generate(create_engine(args.database_url), args.shows,
+                                      args.venues, args.artists, args.seed)
+    elapsed = time.perf_counter() - started
+    print('%d venues, %d artists, %d shows in %.1fs (%.0f shows/s)' % (
+        venues, artists, shows, elapsed, shows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Fail if any view's queries fall back to a full scan of the shows table.
+
+    python -m benchmarks.query_plans                       # throwaway SQLite file
+    python -m benchmarks.query_plans --database-url postgresql://localhost/fyyur_plans
+
+Every route is requested through the Flask test client against a small
+seeded database. The statements each route sends are captured from the
+engine and replayed under EXPLAIN (EXPLAIN QUERY PLAN on SQLite); the run
+exits non-zero if a plan reads `shows` without an index, or (through
+QUERY_STATS_STRICT) if a route goes over its query budget. On Postgres the
+planner is told to avoid sequential scans, so a seq scan in the output
+means no usable index exists rather than that the table is small.
+
+The target database is dropped and recreated, never point this at real data.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+from app import create_app
+from benchmarks.venue_directory import seed
+from models import db
+
+# Tables that are always read through an index; listing pages may still
+# scan venues and artists.
+INDEXED_TABLES = ('shows', 'show_days')
+
+ROUTES = [
+    ('GET', '/venues', None),
+    ('GET', '/venues?genre=Jazz', None),
+    ('GET', '/venues/1', None),
+    ('GET', '/venues/near?lat=37.7749&lng=-122.4194', None),
+    ('POST', '/venues/search', {'search_term': 'venue'}),
+    ('GET', '/artists', None),
+    ('GET', '/artists/1', None),
+    ('POST', '/artists/search', {'search_term': 'artist'}),
+    ('GET', '/shows', None),
+    ('GET', '/shows?city=City+1&state=CA&from=2026-01-01&to=2026-12-31', None),
+    ('GET', '/shows?venue_id=1&month=2026-10', None),
+    ('GET', '/shows?genre=Rock+n+Roll', None),
+    ('GET', '/api/v1/venues', None),
+    ('GET', '/api/v1/venues/1', None),
+    ('GET', '/api/v1/venues/search?q=venue', None),
+    ('GET', '/api/v1/venues/genres', None),
+    ('GET', '/api/v1/venues/near?city=San+Francisco&state=CA', None),
+    ('GET', '/api/v1/artists', None),
+    ('GET', '/api/v1/artists/1', None),
+    ('GET', '/api/v1/shows', None),
+    ('GET', '/api/v1/shows?artist_id=1&from=2026-10-01', None),
+    ('GET', '/api/v1/shows/calendar?month=2026-10&city=City+1&state=CA', None),
+    ('GET', '/api/v1/venues/1/free-slots', None),
+    ('POST', '/shows/create', {'artist_id': '1', 'venue_id': '1', 'start_time': '2030-01-01 20:00'}),
+    ('DELETE', '/venues/2', None),
+]
+
+
+def full_scans(conn, statement, parameters):
+    """Return the tables from INDEXED_TABLES that `statement` scans fully."""
+    if conn.dialect.name == 'sqlite':
+        plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        lines = [row[-1] for row in plan]
+        pattern = r'^SCAN (%s)\b(?!.*USING (COVERING )?INDEX)'
+    else:
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        plan = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+        lines = [row[0].strip() for row in plan]
+        pattern = r'Seq Scan on (%s)\b'
+    pattern = pattern % '|'.join(INDEXED_TABLES)
+    return [line for line in lines if re.search(pattern, line)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'query_plans.db')
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'QUERY_STATS_STRICT': True
+    })
+
+    failures = 0
+    with app.app_context():
+        engine = db.get_engine()
+        seed(engine, 50, 2000)
+
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                captured.append((statement, parameters))
+
+        client = app.test_client()
+        for method, path, data in ROUTES:
+            del captured[:]
+            event.listen(engine, 'before_cursor_execute', capture)
+            try:
+                response = client.open(path, method=method, data=data)
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+            print('%s %s -> %d (%d statements)' % (method, path, response.status_code, len(captured)))
+
+            with engine.connect() as conn:
+                for statement, parameters in captured:
+                    for line in full_scans(conn, statement, parameters):
+                        failures += 1
+                        print('  FULL SCAN: %s\n    %s' % (line, ' '.join(statement.split())))
+
+    if failures:
+        print('%d statement(s) scan an indexed table' % failures)
+        sys.exit(1)
+    print('all plans use indexes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Check that read-only views read from the replica, and the primary when they must.
+
+    python -m benchmarks.replica_routing
+    python -m benchmarks.replica_routing --primary-url postgresql://localhost/fyyur --replica-url postgresql://replica/fyyur
+
+Without URLs the primary and the replica are two throwaway SQLite files,
+the replica "replicated" by copying the primary's file over it. Checks that
+a listing reads from the replica, that a client which has just written
+reads its own writes from the primary, and (SQLite only, where the lag can
+be staged) that a replica behind the primary is passed over. Exits non-zero
+on the first failed check.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+from app import create_app
+from models import db
+from replicas import NEWEST_WRITE
+
+VENUE_FORM = dict(name='Replica Check Venue', city='San Francisco', state='CA', address='1 Main St',
+                  phone='555-555-5555', image_link='', genres='Jazz', facebook_link='', website_link='',
+                  seeking_description='')
+
+
+def databases_read(client, method, path, data=None):
+    """The databases `path` ran statements on, leaving out the lag checks."""
+    databases = set()
+
+    def listener(conn, cursor, statement, *args):
+        if statement != str(NEWEST_WRITE.compile(dialect=conn.dialect)):
+            databases.add(make_url(conn.engine.url).database)
+    event.listen(Engine, 'before_cursor_execute', listener)
+    try:
+        client.open(path, method=method, data=data)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', listener)
+    return databases
+
+
+def check(ok, message):
+    print('%-60s %s' % (message, 'ok' if ok else 'FAILED'))
+    if not ok:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--primary-url')
+    parser.add_argument('--replica-url')
+    args = parser.parse_args()
+
+    if args.primary_url and args.replica_url:
+        primary_url, replica_url, files = args.primary_url, args.replica_url, None
+    else:
+        directory = tempfile.mkdtemp()
+        files = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+        primary_url, replica_url = ['sqlite:///' + path for path in files]
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': primary_url,
+        'DATABASE_REPLICA_URLS': [replica_url],
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'CACHE_TTL': 0,
+        'REPLICA_LAG_CHECK_INTERVAL': 0,
+        # Any write the copy lacks puts it behind.
+        'REPLICA_MAX_LAG': 0 if files else 5
+    })
+    primary, replica = make_url(primary_url).database, make_url(replica_url).database
+    with app.app_context():
+        if files:
+            db.create_all()
+            shutil.copy(*files)
+
+        client = app.test_client()
+        check(databases_read(client, 'GET', '/venues') == {replica}, 'GET /venues reads the replica')
+        check(databases_read(client, 'GET', '/api/v1/artists') == {replica}, 'GET /api/v1/artists reads the replica')
+        check(primary in databases_read(client, 'POST', '/venues/create', VENUE_FORM), 'POST /venues/create writes the primary')
+        check(databases_read(client, 'GET', '/venues') == {primary}, 'the writer then reads /venues from the primary')
+
+        if files:
+            other = app.test_client()
+            check(databases_read(other, 'GET', '/venues') == {primary}, 'a replica behind the primary is passed over')
+            shutil.copy(*files)
+            check(databases_read(other, 'GET', '/venues') == {replica}, 'the replica is used again once it catches up')
+    print('replica routing OK')
+
+
+if __name__ == '__main__':
+    main()
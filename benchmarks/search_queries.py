@@ -0,0 +1,57 @@
+"""Check that search costs a fixed number of statements however many rows match.
+
+    python -m benchmarks.search_queries
+
+Seeds a throwaway SQLite file with an increasing number of venues and
+artists whose names all match the search term, posts the search forms and
+exits non-zero if the statement count grows with the number of matches.
+"""
+import os
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+from app import create_app
+from benchmarks.venue_directory import seed
+from models import db
+
+SCALES = (10, 100, 1000)
+
+
+def main():
+    counts = {}
+    for scale in SCALES:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'search.db'),
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SEARCH_RESULTS_LIMIT': max(SCALES)
+        })
+        with app.app_context():
+            engine = db.get_engine()
+            # seed() names everything "Venue <n>" / "Artist <n>" and makes
+            # one artist per ten venues, so every row matches its term.
+            seed(engine, scale * 10, scale * 50)
+            client = app.test_client()
+            for path, term in (('/venues/search', 'venue'), ('/artists/search', 'artist')):
+                client.post(path, data={'search_term': term})  # warm the n-gram index
+
+                statements = []
+                listener = lambda *args: statements.append(args[2])
+                event.listen(engine, 'before_cursor_execute', listener)
+                try:
+                    client.post(path, data={'search_term': term})
+                finally:
+                    event.remove(engine, 'before_cursor_execute', listener)
+                counts.setdefault(path, []).append(len(statements))
+                print('%-16s scale %-5d -> %d statements' % (path, scale, len(statements)))
+
+    if any(len(set(per_scale)) > 1 for per_scale in counts.values()):
+        print('statement count depends on the number of matches')
+        sys.exit(1)
+    print('search statement count is constant')
+
+
+if __name__ == '__main__':
+    main()
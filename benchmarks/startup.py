@@ -0,0 +1,65 @@
+"""Time from `import app` to the first served request, before and after a change.
+
+    python -m benchmarks.startup --before <git ref>
+
+The tree at `--before` is exported to a temporary directory and both trees
+are started in fresh interpreters `--runs` times. Each run imports the app
+module, obtains an application (create_app() when the module has one, the
+module-level `app` otherwise) and serves GET / through the test client, which
+renders a template but needs no database.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+PROBE = '''
+import time
+started = time.perf_counter()
+import app as module
+application = module.create_app() if hasattr(module, 'create_app') else module.app
+imported = time.perf_counter()
+application.test_client().get('/')
+print(imported - started, time.perf_counter() - started)
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def export(ref):
+    directory = tempfile.mkdtemp(prefix='fyyur-startup-')
+    archive = os.path.join(directory, 'tree.tar')
+    with open(archive, 'wb') as out:
+        subprocess.check_call(['git', 'archive', ref], cwd=ROOT, stdout=out)
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+    return directory
+
+
+def measure(directory, runs):
+    imports, first_requests = [], []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=directory)
+        imported, served = map(float, output.split()[-2:])
+        imports.append(imported)
+        first_requests.append(served)
+    return imports, first_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--before', default='HEAD~1', help='git ref to compare the working tree with')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for label, directory in (('before', export(args.before)), ('after', ROOT)):
+        imports, first_requests = measure(directory, args.runs)
+        print('%-6s import=%7.1fms  import+first request=%7.1fms  (median of %d)' % (
+            label, statistics.median(imports) * 1000, statistics.median(first_requests) * 1000, args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Compare the /venues listing before and after the single-statement directory query.
+
+    python -m benchmarks.venue_directory --seed --venues 10000 --shows 1000000
+
+The legacy path replays what the view used to do (one GROUP BY, one query
+per area, one query per venue); the new path is queries.venue_directory,
+which reads the show_counts counters.
+Both are timed against the same database and the number of statements each
+one sends is counted through SQLAlchemy's cursor events.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+import config
+from models import db, Venue, Artist, Show, DEFAULT_SHOW_DURATION
+from queries import venue_directory
+import show_calendar
+import show_counts
+
+CHUNK_SIZE = 10000
+
+
+class QueryCounter(object):
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def seed(engine, num_venues, num_shows):
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS earthdistance CASCADE')
+            conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    rng = random.Random(0)
+    num_artists = max(num_venues // 10, 1)
+    num_cities = max(num_venues // 50, 1)
+    now = datetime.now()
+
+    with engine.begin() as conn:
+        conn.execute(Artist.__table__.insert(), [{
+            "id": i + 1,
+            "name": "Artist %d" % i,
+            "city": "City %d" % (i % num_cities),
+            "state": "CA",
+            "phone": "555-555-5555",
+            "genres": ["Rock n Roll"]
+        } for i in range(num_artists)])
+        conn.execute(Venue.__table__.insert(), [{
+            "id": i + 1,
+            "name": "Venue %d" % i,
+            "city": "City %d" % (i % num_cities),
+            "state": "CA",
+            "address": "%d Main St" % i,
+            "genres": ["Jazz"]
+        } for i in range(num_venues)])
+        # Rounds of shows a booking apart, each round at different venues by
+        # different artists, so that no two bookings overlap.
+        per_round = min(num_venues, num_artists, CHUNK_SIZE)
+        rounds = -(-num_shows // per_round)
+        for i in range(rounds):
+            size = min(per_round, num_shows - i * per_round)
+            start_time = now + (i - rounds // 2) * DEFAULT_SHOW_DURATION
+            conn.execute(Show.__table__.insert(), [{
+                "artist_id": artist_id,
+                "venue_id": venue_id,
+                "start_time": start_time
+            } for artist_id, venue_id in zip(rng.sample(range(1, num_artists + 1), size),
+                                             rng.sample(range(1, num_venues + 1), size))])
+    with Session(engine) as session:
+        show_counts.rebuild(session, now)
+        show_calendar.rebuild(session)
+
+
+def legacy_venue_directory(session, now):
+    areas = []
+    for city, state in session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state).all():
+        venues = session.query(Venue.id, Venue.name).filter(Venue.city == city, Venue.state == state).all()
+        areas.append({"city": city, "state": state, "venues": []})
+        for venue_id, name in venues:
+            upcoming = session.query(Show.venue_id, Show.start_time).filter(Show.venue_id == venue_id, Show.start_time > now).all()
+            areas[-1]["venues"].append({"id": venue_id, "name": name, "num_upcoming_shows": len(upcoming)})
+    return areas
+
+
+def measure(engine, counter, fn, repeat):
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with Session(engine) as session:
+            counter.count = 0
+            started = time.perf_counter()
+            fn(session)
+            timings.append(time.perf_counter() - started)
+            queries = counter.count
+    return queries, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=config.SQLALCHEMY_DATABASE_URI)
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', action='store_true',
+                        help='drop and recreate the tables with synthetic data first')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if args.seed:
+        seed(engine, args.venues, args.shows)
+    counter = QueryCounter(engine)
+
+    legacy = lambda session: legacy_venue_directory(session, datetime.now())
+    for label, fn in (('legacy', legacy), ('counters', venue_directory)):
+        queries, timings = measure(engine, counter, fn, args.repeat)
+        print('%-10s queries=%-7d median=%8.1fms  min=%8.1fms' % (
+            label, queries, statistics.median(timings) * 1000, min(timings) * 1000))
+
+
+if __name__ == '__main__':
+    main()
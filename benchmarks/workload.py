@@ -0,0 +1,376 @@
+"""Drive every route with a weighted read/write mix and report a JSON baseline.
+
+    python -m benchmarks.workload --output baseline.json
+    python -m benchmarks.workload --compare benchmarks/baseline.json
+    python -m benchmarks.workload --database-url postgresql://localhost/fyyur_bench --generate 1000000
+
+Each simulated user is a thread with its own test client that picks tasks by
+weight, Locust style: about nine in ten requests are page views, searches
+and JSON API reads, the rest create, edit and delete records. Latency is
+measured around each request; query counts come from the Server-Timing
+header that query_stats adds. The report holds p50/p95/p99 latency, throughput and
+queries per request, overall and per task.
+
+With --compare the run exits non-zero when a task sends more statements than
+it did in the baseline, or, given --latency-tolerance, when its p95 grew by
+more than that factor. Query counts are stable between machines and make a
+good CI gate; latencies are only comparable on the same hardware.
+
+Without --database-url the run uses a throwaway SQLite file filled by
+benchmarks.datagen. --generate recreates the target tables, never point it
+at real data.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import create_app
+from benchmarks.datagen import ADJECTIVES, ARTIST_NOUNS, CITIES, GENRES, VENUE_NOUNS, generate
+from models import db, Venue, Artist, Show
+from queries import encode_cursor
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+# Share of venue ids set aside for the delete task, so that reads never hit
+# a venue another user has just deleted.
+DELETABLE_SHARE = 0.1
+
+
+class Dataset(object):
+    """Ids the tasks pick from, shared between users."""
+
+    def __init__(self, num_venues, num_artists):
+        self.num_artists = num_artists
+        self.num_readable_venues = max(int(num_venues * (1 - DELETABLE_SHARE)), 1)
+        self._deletable = list(range(self.num_readable_venues + 1, num_venues + 1))
+        self._lock = threading.Lock()
+
+    def venue_id(self, rng):
+        return rng.randint(1, self.num_readable_venues)
+
+    def artist_id(self, rng):
+        return rng.randint(1, self.num_artists)
+
+    def take_deletable_venue(self):
+        with self._lock:
+            return self._deletable.pop() if self._deletable else None
+
+
+def _venue_form(rng):
+    city, state = rng.choice(CITIES)
+    return {
+        'name': 'The %s %s' % (rng.choice(ADJECTIVES), rng.choice(VENUE_NOUNS)),
+        'city': city,
+        'state': state,
+        'address': '%d Main St' % rng.randint(1, 9999),
+        'phone': '555-555-5555',
+        'image_link': 'https://images.example.com/venues/new.jpg',
+        'genres': rng.sample(GENRES, 2),
+        'facebook_link': 'https://www.facebook.com/newvenue',
+        'website_link': 'https://www.newvenue.com',
+        'seeking_talent': 'y',
+        'seeking_description': 'Looking for a house band.'
+    }
+
+
+def _artist_form(rng):
+    city, state = rng.choice(CITIES)
+    return {
+        'name': 'The %s %s' % (rng.choice(ADJECTIVES), rng.choice(ARTIST_NOUNS)),
+        'city': city,
+        'state': state,
+        'phone': '555-555-5555',
+        'image_link': 'https://images.example.com/artists/new.jpg',
+        'genres': rng.sample(GENRES, 2),
+        'facebook_link': 'https://www.facebook.com/newartist',
+        'website_link': 'https://www.newartist.com',
+        'seeking_venue': 'y',
+        'seeking_description': 'Touring next spring.'
+    }
+
+
+# Each task returns (method, path, form data) for one request.
+def home(rng, data):
+    return 'GET', '/', None
+
+def venue_list(rng, data):
+    return 'GET', '/venues', None
+
+def venue_search(rng, data):
+    return 'POST', '/venues/search', {'search_term': rng.choice(ADJECTIVES + VENUE_NOUNS)[:rng.randint(3, 6)]}
+
+def venue_detail(rng, data):
+    return 'GET', '/venues/%d' % data.venue_id(rng), None
+
+def artist_list(rng, data):
+    return 'GET', '/artists', None
+
+def artist_search(rng, data):
+    return 'POST', '/artists/search', {'search_term': rng.choice(ADJECTIVES + ARTIST_NOUNS)[:rng.randint(3, 6)]}
+
+def artist_detail(rng, data):
+    return 'GET', '/artists/%d' % data.artist_id(rng), None
+
+def show_list(rng, data):
+    return 'GET', '/shows', None
+
+def show_list_page(rng, data):
+    return 'GET', '/shows?after=%s' % encode_cursor(datetime.now(), 0), None
+
+def venue_create_form(rng, data):
+    return 'GET', '/venues/create', None
+
+def artist_create_form(rng, data):
+    return 'GET', '/artists/create', None
+
+def show_create_form(rng, data):
+    return 'GET', '/shows/create', None
+
+def venue_edit_form(rng, data):
+    return 'GET', '/venues/%d/edit' % data.venue_id(rng), None
+
+def artist_edit_form(rng, data):
+    return 'GET', '/artists/%d/edit' % data.artist_id(rng), None
+
+def internal_metrics(rng, data):
+    return 'GET', '/internal/metrics', None
+
+def api_venue_list(rng, data):
+    return 'GET', '/api/v1/venues?fields=id,name,city,state,num_upcoming_shows', None
+
+def api_venue_detail(rng, data):
+    return 'GET', '/api/v1/venues/%d' % data.venue_id(rng), None
+
+def api_artist_list(rng, data):
+    return 'GET', '/api/v1/artists', None
+
+def api_artist_detail(rng, data):
+    return 'GET', '/api/v1/artists/%d?fields=id,name,upcoming_shows' % data.artist_id(rng), None
+
+def api_show_list(rng, data):
+    return 'GET', '/api/v1/shows?after=%s' % encode_cursor(datetime.now(), 0), None
+
+def api_search(rng, data):
+    return 'GET', '/api/v1/artists/search?q=%s' % rng.choice(ARTIST_NOUNS)[:4], None
+
+def venue_create(rng, data):
+    return 'POST', '/venues/create', _venue_form(rng)
+
+def artist_create(rng, data):
+    return 'POST', '/artists/create', _artist_form(rng)
+
+def show_create(rng, data):
+    return 'POST', '/shows/create', {
+        'artist_id': str(data.artist_id(rng)),
+        'venue_id': str(data.venue_id(rng)),
+        'start_time': '%d-%02d-%02d 20:00:00' % (datetime.now().year + 1, rng.randint(1, 12), rng.randint(1, 28))
+    }
+
+def venue_edit(rng, data):
+    return 'POST', '/venues/%d/edit' % data.venue_id(rng), _venue_form(rng)
+
+def artist_edit(rng, data):
+    return 'POST', '/artists/%d/edit' % data.artist_id(rng), _artist_form(rng)
+
+def venue_delete(rng, data):
+    venue_id = data.take_deletable_venue()
+    if venue_id is None:
+        return venue_detail(rng, data)
+    return 'DELETE', '/venues/%d' % venue_id, None
+
+
+TASKS = [
+    (4, home),
+    (8, venue_list),
+    (6, venue_search),
+    (15, venue_detail),
+    (8, artist_list),
+    (6, artist_search),
+    (15, artist_detail),
+    (8, show_list),
+    (4, show_list_page),
+    (1, venue_create_form),
+    (1, artist_create_form),
+    (1, show_create_form),
+    (1, venue_edit_form),
+    (1, artist_edit_form),
+    (1, internal_metrics),
+    (2, api_venue_list),
+    (4, api_venue_detail),
+    (2, api_artist_list),
+    (4, api_artist_detail),
+    (3, api_show_list),
+    (2, api_search),
+    (2, venue_create),
+    (2, artist_create),
+    (3, show_create),
+    (1, venue_edit),
+    (1, artist_edit),
+    (1, venue_delete),
+]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0))]
+
+
+def summarize(samples):
+    """Latency and query statistics for a list of (seconds, queries, ok) samples."""
+    latencies = sorted(seconds * 1000 for seconds, queries, ok in samples)
+    queries = [queries for seconds, queries, ok in samples if queries is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for seconds, queries, ok in samples if not ok),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3)
+        },
+        "queries": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "max": max(queries) if queries else None
+        }
+    }
+
+
+def user(app, data, seed, num_requests, samples):
+    rng = random.Random(seed)
+    weights = [weight for weight, task in TASKS]
+    client = app.test_client()
+    for _ in range(num_requests):
+        weight, task = rng.choices(TASKS, weights=weights)[0]
+        method, path, form = task(rng, data)
+        started = time.perf_counter()
+        try:
+            response = client.open(path, method=method, data=form)
+        except Exception:
+            samples.append((task.__name__, time.perf_counter() - started, None, False))
+            continue
+        elapsed = time.perf_counter() - started
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        samples.append((task.__name__, elapsed, int(match.group(1)) if match else None, response.status_code < 500))
+
+
+def run(app, data, users, num_requests, seed):
+    samples = []
+    per_user = [num_requests // users + (1 if i < num_requests % users else 0) for i in range(users)]
+    threads = [threading.Thread(target=user, args=(app, data, seed + i, per_user[i], samples)) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    summary = summarize([sample[1:] for sample in samples])
+    summary["duration_s"] = round(duration, 3)
+    summary["throughput_rps"] = round(len(samples) / duration, 2)
+    routes = {}
+    for weight, task in TASKS:
+        task_samples = [sample[1:] for sample in samples if sample[0] == task.__name__]
+        if task_samples:
+            routes[task.__name__] = summarize(task_samples)
+    return summary, routes
+
+
+def compare(report, baseline, latency_tolerance=None):
+    """Return the regressions of `report` against `baseline`, one line each."""
+    regressions = []
+    for name, route in sorted(report["routes"].items()):
+        before = baseline["routes"].get(name)
+        if before is None:
+            continue
+        if route["queries"]["max"] is not None and before["queries"]["max"] is not None \
+                and route["queries"]["max"] > before["queries"]["max"]:
+            regressions.append('%s: up to %d queries per request, baseline %d' % (
+                name, route["queries"]["max"], before["queries"]["max"]))
+        if latency_tolerance and route["latency_ms"]["p95"] > before["latency_ms"]["p95"] * latency_tolerance:
+            regressions.append('%s: p95 %.1fms, baseline %.1fms' % (
+                name, route["latency_ms"]["p95"], before["latency_ms"]["p95"]))
+        if route["errors"] > before["errors"]:
+            regressions.append('%s: %d errors, baseline %d' % (name, route["errors"], before["errors"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--generate', type=int, metavar='SHOWS',
+                        help='recreate the tables with this many synthetic shows first (default 10000 on the throwaway database)')
+    parser.add_argument('--users', type=int, default=1, help='concurrent simulated users (threads)')
+    parser.add_argument('--requests', type=int, default=1000, help='requests across all users')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON report of an earlier run to check against')
+    parser.add_argument('--latency-tolerance', type=float, metavar='FACTOR',
+                        help='with --compare, fail when a p95 exceeds the baseline by this factor')
+    args = parser.parse_args()
+
+    database_url, generate_shows = args.database_url, args.generate
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'workload.db')
+        generate_shows = generate_shows or 10000
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False
+    })
+    with app.app_context():
+        if generate_shows:
+            generate(db.get_engine(), generate_shows, seed=args.seed)
+        num_venues = db.session.query(func.max(Venue.id)).scalar() or 0
+        num_artists = db.session.query(func.max(Artist.id)).scalar() or 0
+        num_shows = db.session.query(func.count(Show.id)).scalar()
+        db.session.remove()
+
+    summary, routes = run(app, Dataset(num_venues, num_artists), args.users, args.requests, args.seed)
+    report = {
+        "config": {
+            "database": db.get_engine(app).dialect.name,
+            "venues": num_venues,
+            "artists": num_artists,
+            "shows": num_shows,
+            "users": args.users,
+            "requests": args.requests,
+            "seed": args.seed
+        },
+        "summary": summary,
+        "routes": routes
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(output + '\n')
+    else:
+        print(output)
+    print('%d requests, %d errors, %.1f req/s, p50=%.1fms p95=%.1fms p99=%.1fms' % (
+        summary["requests"], summary["errors"], summary["throughput_rps"], summary["latency_ms"]["p50"],
+        summary["latency_ms"]["p95"], summary["latency_ms"]["p99"]), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.latency_tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against %s' % args.compare, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+from bisect import bisect_left, insort
+
+from sqlalchemy import select, union
+
+from models import Show, MAX_SHOW_DURATION
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#
+# A show books its venue and its artist from start_time to end_time, and
+# neither can be booked twice over. On Postgres the exclusion constraints
+# over tsrange(start_time, end_time) enforce that (see the add_show_end_time
+# migration); the check here turns a clash into a readable answer before the
+# insert, and is the only guard on SQLite. No show lasts longer than
+# MAX_SHOW_DURATION, so any show overlapping [start, end) started less than
+# that before `start`: every lookup is one range read of the
+# (venue_id, start_time) or (artist_id, start_time) index, however many
+# shows the venue has had. Imports check a whole batch at once, against
+# the database and against the batch itself.
+#----------------------------------------------------------------------------#
+
+# SQLSTATE of a Postgres exclusion constraint violation.
+EXCLUSION_VIOLATION = '23P01'
+
+
+class BookingConflict(ValueError):
+    """The venue or the artist is already booked for part of the time."""
+
+    def __init__(self, venue_id, artist_id, conflicts):
+        self.conflicts = conflicts
+        messages = []
+        for show in conflicts:
+            who = 'Venue %s' % venue_id if show.venue_id == venue_id else 'Artist %s' % artist_id
+            messages.append('%s is booked from %s to %s' % (
+                who, show.start_time.strftime('%Y-%m-%d %H:%M'), show.end_time.strftime('%Y-%m-%d %H:%M')))
+        super(BookingConflict, self).__init__('; '.join(messages))
+
+
+def _overlapping(key, id, start_time, end_time):
+    return select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).where(
+        key == id,
+        Show.start_time > start_time - MAX_SHOW_DURATION,
+        Show.start_time < end_time,
+        Show.end_time > start_time
+    )
+
+
+def conflicts(session, venue_id, artist_id, start_time, end_time):
+    """Shows at the venue or of the artist overlapping [start_time, end_time)."""
+    statement = union(
+        _overlapping(Show.venue_id, venue_id, start_time, end_time),
+        _overlapping(Show.artist_id, artist_id, start_time, end_time)
+    ).order_by('start_time')
+    return session.execute(statement).all()
+
+
+def check_available(session, venue_id, artist_id, start_time, end_time):
+    """Raise BookingConflict unless both the venue and the artist are free."""
+    found = conflicts(session, venue_id, artist_id, start_time, end_time)
+    if found:
+        raise BookingConflict(venue_id, artist_id, found)
+
+
+class _Booking(object):
+    """A show not yet written, shaped like the rows conflicts() returns."""
+
+    def __init__(self, venue_id, artist_id, start_time, end_time):
+        self.venue_id = venue_id
+        self.artist_id = artist_id
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class _Calendar(object):
+    """The bookings of one venue or artist, by start time."""
+
+    def __init__(self):
+        self.bookings = []
+
+    def add(self, booking):
+        insort(self.bookings, (booking.start_time, id(booking), booking))
+
+    def overlapping(self, start_time, end_time):
+        first = bisect_left(self.bookings, (start_time - MAX_SHOW_DURATION,))
+        return [booking for booking_start, _, booking in self.bookings[first:]
+                if booking_start < end_time and booking.end_time > start_time]
+
+
+def batch_conflicts(session, bookings):
+    """Check new bookings, given as (venue_id, artist_id, start_time,
+    end_time), against the shows already booked and against each other: a
+    booking that clashes with an earlier one of `bookings` loses.
+
+    Returns a BookingConflict, or None, per booking. The shows already
+    booked come from one range read of each index, over the span the new
+    bookings cover.
+    """
+    if not bookings:
+        return []
+    earliest = min(booking[2] for booking in bookings) - MAX_SHOW_DURATION
+    latest = max(booking[3] for booking in bookings)
+    calendars = {}
+    for position, key in enumerate((Show.venue_id, Show.artist_id)):
+        ids = set(booking[position] for booking in bookings)
+        for show in session.execute(select(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).where(
+                key.in_(ids), Show.start_time > earliest, Show.start_time < latest)):
+            calendars.setdefault((position, show[position]), _Calendar()).add(show)
+
+    results = []
+    for venue_id, artist_id, start_time, end_time in bookings:
+        venue = calendars.setdefault((0, venue_id), _Calendar())
+        artist = calendars.setdefault((1, artist_id), _Calendar())
+        found = set(venue.overlapping(start_time, end_time) + artist.overlapping(start_time, end_time))
+        if found:
+            results.append(BookingConflict(venue_id, artist_id, sorted(found, key=lambda show: show.start_time)))
+            continue
+        booking = _Booking(venue_id, artist_id, start_time, end_time)
+        venue.add(booking)
+        artist.add(booking)
+        results.append(None)
+    return results
+
+
+def is_conflict_error(error):
+    """Whether a DBAPIError is an exclusion constraint refusing a booking,
+    i.e. a concurrent insert won the race past check_available()."""
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == EXCLUSION_VIOLATION
+
+
+def free_slots(session, venue_id, start, end, min_duration=None):
+    """The (start, end) gaps between the venue's bookings within [start, end),
+    in order, leaving out gaps shorter than `min_duration`.
+    """
+    booked = session.query(Show.start_time, Show.end_time).filter(
+        Show.venue_id == venue_id,
+        Show.start_time > start - MAX_SHOW_DURATION,
+        Show.start_time < end,
+        Show.end_time > start
+    ).order_by(Show.start_time)
+
+    slots, free_from = [], start
+    for booked_from, booked_until in booked:
+        if booked_from > free_from and (min_duration is None or booked_from - free_from >= min_duration):
+            slots.append((free_from, booked_from))
+        free_from = max(free_from, booked_until)
+    if end > free_from and (min_duration is None or end - free_from >= min_duration):
+        slots.append((free_from, end))
+    return slots
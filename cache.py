@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from models import Show
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Venue and artist detail pages are read far more often than they change, so
+# the dicts their views build are kept in a read-through cache. Write
+# handlers drop exactly the keys whose pages they changed, and a page expires
+# when its first upcoming show starts, as the clock moves that show to past
+# (and the page's ETag, see http_cache, moves with it).
+#----------------------------------------------------------------------------#
+
+# What a backend's get() returns for a key it does not hold.
+MISSING = object()
+
+
+class LRUBackend(object):
+    """In-process cache holding at most `max_entries` values."""
+
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class RedisBackend(object):
+    """Cache shared between workers, on any client with the redis-py
+    get/set/delete interface (redis.Redis, or a fake in tests).
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix='fyyur:page:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return MISSING
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), px=max(int(ttl * 1000), 1))
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+
+class _PageCacheState(object):
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+class PageCache(object):
+    """Flask extension giving each application its own cache backend and
+    counters, configured from CACHE_BACKEND and friends.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, redis_client=None):
+        if app.config.get('CACHE_BACKEND') == 'redis':
+            if redis_client is None:
+                import redis
+                redis_client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            backend = RedisBackend(redis_client)
+        else:
+            backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        app.extensions['page_cache'] = _PageCacheState(backend, app.config.get('CACHE_TTL', 300))
+
+    @property
+    def _state(self):
+        return current_app.extensions['page_cache']
+
+    @property
+    def shared(self):
+        """Whether every process of the application sees the same cache."""
+        return self._state.backend.shared
+
+    def get_or_set(self, key, build, expires=None, store=True):
+        """Return the cached value for `key`, calling `build()` to fill a miss.
+
+        `expires(value)`, if given, is the time.time() at which the value goes
+        stale by itself, or None; it is kept no longer than that nor than the
+        TTL. None (no such venue or artist) is returned but not cached: the
+        row may be created, and the page asked for, before the TTL is up.
+        `store=False` leaves a miss unfilled, for values built from a read
+        replica: a page behind the primary would be served to everyone,
+        including the client that just wrote, until it expired.
+        """
+        state = self._state
+        value = state.backend.get(key)
+        if value is not MISSING:
+            state.hits += 1
+            return value
+        state.misses += 1
+        value = build()
+        if store:
+            self._set(state, key, value, expires)
+        return value
+
+    async def get_or_set_async(self, key, build, expires=None, store=True):
+        """get_or_set() for async views, where `build()` returns an awaitable."""
+        state = self._state
+        value = state.backend.get(key)
+        if value is not MISSING:
+            state.hits += 1
+            return value
+        state.misses += 1
+        value = await build()
+        if store:
+            self._set(state, key, value, expires)
+        return value
+
+    def _set(self, state, key, value, expires):
+        if value is None:
+            return
+        ttl = state.ttl
+        stale_at = expires(value) if expires is not None else None
+        if stale_at is not None:
+            ttl = min(ttl, stale_at - time.time())
+        if ttl > 0:
+            state.backend.set(key, value, ttl)
+
+    def invalidate(self, keys):
+        state = self._state
+        keys = list(keys)
+        state.invalidations += len(keys)
+        state.backend.delete(keys)
+
+    def stats(self):
+        state = self._state
+        return {
+            "backend": type(state.backend).__name__,
+            "hits": state.hits,
+            "misses": state.misses,
+            "invalidations": state.invalidations
+        }
+
+
+# The application's page cache; create_app() binds it.
+page_cache = PageCache()
+
+
+def venue_key(venue_id):
+    return 'venue:%d' % int(venue_id)
+
+
+def artist_key(artist_id):
+    return 'artist:%d' % int(artist_id)
+
+
+def venue_page_keys(session, venue_id):
+    """Keys of every page that renders this venue: its own and those of the
+    artists that play (or played) there.
+    """
+    artist_ids = session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    return [venue_key(venue_id)] + [artist_key(artist_id) for artist_id, in artist_ids]
+
+
+def artist_page_keys(session, artist_id):
+    """Keys of every page that renders this artist."""
+    venue_ids = session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    return [artist_key(artist_id)] + [venue_key(venue_id) for venue_id, in venue_ids]
@@ -10,5 +10,127 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://timmytech@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://timmytech@localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool, per worker process. Each setting can be overridden by the
+# environment variable of the same name. DATABASE_STATEMENT_TIMEOUT is in
+# milliseconds and 0 disables it.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 0))
+
+# Async read path (async_views.py). With ASYNC_READS the listings, detail
+# pages and search run as async views on an async engine, one pool per
+# worker process sized by the settings above. ASYNC_DATABASE_URL defaults to
+# DATABASE_URL with its asyncio driver (needs asyncpg or aiosqlite).
+ASYNC_READS = os.environ.get('ASYNC_READS', 'false').lower() in ('1', 'true', 'yes')
+ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+
+# Who may read /internal/metrics: with INTERNAL_METRICS_TOKEN set, requests
+# sending "Authorization: Bearer <token>"; otherwise clients connecting from
+# INTERNAL_ALLOWED_ADDRS, and never requests carrying X-Forwarded-For or
+# Forwarded. Behind a reverse proxy, where every client connects from
+# loopback, set the token (or keep /internal/ off the proxy).
+INTERNAL_METRICS_TOKEN = os.environ.get('INTERNAL_METRICS_TOKEN')
+INTERNAL_ALLOWED_ADDRS = ('127.0.0.1', '::1')
+
+# Shows listed per page on /shows; ?per_page= can ask for up to the maximum.
+SHOWS_PER_PAGE = 24
+SHOWS_MAX_PER_PAGE = 100
+
+# Most relevant matches returned by venue and artist search.
+SEARCH_RESULTS_LIMIT = 50
+
+# Offline geocoding: venues are placed at their city's coordinates from this
+# table (columns city, state, latitude, longitude); see geocoding.py.
+GEOCODING_PLACES_FILE = os.path.join(basedir, 'data', 'places.csv')
+
+# Venues listed per page on /venues/near, nearest first.
+VENUES_NEAR_PER_PAGE = 20
+
+# Venue and artist detail page cache: 'lru' keeps pages per process, 'redis'
+# shares them between workers through CACHE_REDIS_URL (needs the redis package).
+CACHE_BACKEND = 'lru'
+CACHE_REDIS_URL = 'redis://localhost:6379/0'
+CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 1024
+
+# Rendered list tiles ({% cache %} blocks), kept per process under their
+# entities' version stamps. Compiled templates are cached on disk, shared by
+# every worker; `flask compile-templates` fills it ahead of a deploy. Unset,
+# TEMPLATE_BYTECODE_CACHE_DIR is Jinja's private per-user temp directory;
+# a directory given here must belong to, and be writable only by, the
+# application's user.
+FRAGMENT_CACHE_MAX_ENTRIES = 10000
+FRAGMENT_CACHE_TTL = 3600
+TEMPLATE_BYTECODE_CACHE = True
+TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+
+# Cache-Control sent with the conditional GET routes, by endpoint. no-cache
+# lets browsers and CDNs store pages but revalidate each use, which costs a
+# 304 until the data changes.
+HTTP_CACHE_CONTROL = {
+    'main.venues': 'public, no-cache',
+    'main.artists': 'public, no-cache',
+    'main.shows': 'public, no-cache',
+    'main.show_venue': 'public, no-cache',
+    'main.show_artist': 'public, no-cache',
+}
+
+# Per-request SQL instrumentation (query_stats.py). A request that runs more
+# than its budget of statements, or one parameterised statement more than
+# QUERY_REPEAT_LIMIT times, is logged as a warning; with QUERY_STATS_STRICT
+# (meant for tests) it raises QueryBudgetExceeded instead.
+QUERY_BUDGET = 10
+QUERY_BUDGETS = {}
+QUERY_REPEAT_LIMIT = 3
+QUERY_STATS_STRICT = False
+
+# Bulk import (`flask import` and POST /import/<kind>). The endpoint only
+# exists when IMPORT_API_TOKEN is set; clients send it as a bearer token.
+IMPORT_API_TOKEN = os.environ.get('IMPORT_API_TOKEN')
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 1000
+
+# Bulk export (`flask export` and GET /export/<kind>), guarded like import.
+EXPORT_API_TOKEN = os.environ.get('EXPORT_API_TOKEN')
+EXPORT_CHUNK_SIZE = 1000
+
+# JSON API (/api/v1) list pages: default and largest ?limit=.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Longest date range /api/v1/venues/<id>/free-slots answers for at once.
+FREE_SLOTS_MAX_DAYS = 31
+
+# Background jobs (jobs.py). Each server process runs JOBS_WORKERS worker
+# threads, started with its first request; 0 leaves the jobs to `flask jobs
+# work`. A failed job is retried after JOBS_RETRY_DELAY seconds, doubling
+# each time, until it has run JOBS_MAX_ATTEMPTS times. A job still running
+# after JOBS_LEASE seconds is taken to have lost its worker and requeued.
+# JOBS_SCHEDULE enqueues a task every so many seconds. Writes enqueue
+# warm-pages only with the 'redis' page cache, which every process shares.
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_POLL_INTERVAL = 1.0
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10
+JOBS_LEASE = 300
+JOBS_KEEP_FINISHED = 86400
+JOBS_SCHEDULE = {
+    'show-counts-rollover': 60,
+}
+
+# Read replicas (replicas.py): comma-separated DATABASE_REPLICA_URLS serve
+# the read-only views while they are at most REPLICA_MAX_LAG seconds behind,
+# checked every REPLICA_LAG_CHECK_INTERVAL seconds. A client that has just
+# written reads from the primary for REPLICA_STICKY_SECONDS. The async read
+# path is not routed; point ASYNC_DATABASE_URL at a replica instead.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = 1
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'fyyur_primary'
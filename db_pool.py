@@ -0,0 +1,186 @@
+import bisect
+import os
+import threading
+import time
+import weakref
+
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import func, orm
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#
+# Pool sizing comes from the DATABASE_POOL_* settings in config.py (which read
+# the environment), applied whenever the engine is created so that a SQLite
+# URL swapped in for tests keeps SQLite's own pooling. The pool records how
+# long each checkout waited, so pools can be sized per worker from
+# /internal/metrics.
+#----------------------------------------------------------------------------#
+
+# Upper bounds, in milliseconds, of the checkout wait histogram buckets.
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, waited * 1000)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets = dict(('le_%dms' % bound, count) for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets))
+            buckets['le_inf'] = self.wait_buckets[-1]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_total, 6),
+                "wait_histogram": buckets
+            }
+
+
+# One engine per worker process, so one set of metrics.
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except Exception:
+            pool_metrics.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.observe(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(config, sa_url):
+    """create_engine() arguments for `sa_url` from the DATABASE_POOL_* settings."""
+    if sa_url.drivername.startswith('sqlite'):
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config['DATABASE_POOL_SIZE'],
+        "max_overflow": config['DATABASE_MAX_OVERFLOW'],
+        "pool_timeout": config['DATABASE_POOL_TIMEOUT'],
+        "pool_recycle": config['DATABASE_POOL_RECYCLE'],
+        "pool_pre_ping": config['DATABASE_POOL_PRE_PING']
+    }
+    if sa_url.drivername.startswith('postgresql') and config['DATABASE_STATEMENT_TIMEOUT']:
+        options["connect_args"] = {
+            "options": "-c statement_timeout=%d" % config['DATABASE_STATEMENT_TIMEOUT']
+        }
+    return options
+
+
+def database_key(url):
+    """`url` without its driver, naming the same database whichever engine
+    (e.g. the sync one or async_db's) reaches it."""
+    return str(url.set(drivername=url.get_backend_name()))
+
+
+def table_stamp(session, model):
+    """(row count, newest updated_at) of `model`'s table, two index reads.
+
+    Every insert, update and delete moves it, whichever process commits it,
+    and nothing uncommitted does: the in-process indexes that stand in for
+    Postgres ones on SQLite are rebuilt when it has moved.
+    """
+    return tuple(session.query(func.count(model.id), func.max(model.updated_at)).one())
+
+
+def pool_status(engine):
+    """Live occupancy of `engine`'s pool plus the checkout wait metrics."""
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow()
+        })
+    status.update(pool_metrics.snapshot())
+    return status
+
+
+class RoutingSession(SignallingSession):
+    """Session that runs the statements of a read-only view on the engine
+    the view was given as `g.read_engine` (a replica, see replicas.py), and
+    everything else on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        engine = g.get('read_engine') if has_app_context() else None
+        if engine is not None and (mapper is None or 'bind_key' not in mapper.persist_selectable.info):
+            return engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with the engine options from engine_options() and
+    sessions that can read from replicas.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super(PooledSQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        options.update(engine_options(app.config, sa_url))
+        return sa_url, options
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+# Applications whose pooled connections must not survive into a forked child,
+# and other engines (replicas.py) likewise.
+_fork_safe_apps = weakref.WeakSet()
+_fork_safe_engines = weakref.WeakSet()
+
+
+def dispose_pools_after_fork(app):
+    """Make forked children (e.g. gunicorn --preload workers) start with an
+    empty pool instead of sharing the parent's database sockets.
+    """
+    _fork_safe_apps.add(app)
+
+
+def dispose_engine_after_fork(engine):
+    """dispose_pools_after_fork() for an engine Flask-SQLAlchemy does not own."""
+    _fork_safe_engines.add(engine)
+
+
+def _dispose_inherited_pools():
+    for app in list(_fork_safe_apps):
+        state = app.extensions.get('sqlalchemy')
+        for connector in (state.connectors.values() if state else ()):
+            if connector._engine is not None:
+                # close=False leaves the parent's connections alone and just
+                # forgets them in the child.
+                connector._engine.dispose(close=False)
+    for engine in list(_fork_safe_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_inherited_pools)
@@ -0,0 +1,184 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Integer
+
+from importer import GENRE_SEPARATOR
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#
+# Whole tables are read through a server-side cursor (yield_per) and encoded
+# a chunk of rows at a time, so memory stays flat however large the catalogue
+# is. Rows come out in updated_at order; `since` restricts the export to rows
+# written at or after a UTC timestamp, and the largest updated_at written is
+# the `since` of the next incremental run. CSV output uses the columns and
+# genre separator that importer.py reads back.
+#----------------------------------------------------------------------------#
+
+MODELS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportProgress(object):
+    """Rows written so far and the watermark for the next incremental export."""
+
+    def __init__(self):
+        self.rows = 0
+        self.watermark = None
+
+
+def parse_since(value):
+    """Parse an ISO 8601 UTC timestamp, as written by ExportProgress.watermark."""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('since must be an ISO 8601 timestamp, e.g. 2026-10-18T02:00:00')
+
+
+def _rows(session, table, since, chunk_size):
+    query = session.query(*table.columns)
+    if since is not None:
+        query = query.filter(table.c.updated_at >= since)
+    return query.order_by(table.c.updated_at, table.c.id).yield_per(chunk_size)
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _track(chunks, progress):
+    for chunk in chunks:
+        progress.rows += len(chunk)
+        progress.watermark = chunk[-1].updated_at
+        yield chunk
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return GENRE_SEPARATOR.join(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return value
+
+
+def _encode_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow([_csv_value(value) for value in row])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _encode_ndjson(columns, chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=_json_default) + '\n' for row in chunk).encode('utf-8')
+
+
+class _ParquetSink(io.RawIOBase):
+    """Write-only file that hands over whatever pyarrow has written so far."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_schema(pa, table):
+    fields = []
+    for column in table.columns:
+        if column.name == 'genres':
+            type = pa.list_(pa.string())
+        elif isinstance(column.type, Boolean):
+            type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            type = pa.int64()
+        elif isinstance(column.type, DateTime):
+            type = pa.timestamp('us')
+        else:
+            type = pa.string()
+        fields.append(pa.field(column.name, type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+def _encode_parquet(table, chunks):
+    # pyarrow is only needed for Parquet exports.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa, table)
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    try:
+        for chunk in chunks:
+            # One row group per chunk.
+            writer.write_table(pa.Table.from_pylist([row._asdict() for row in chunk], schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export(session, kind, format='csv', since=None, chunk_size=1000, progress=None):
+    """Yield `kind` ('venues', 'artists' or 'shows') encoded as `format`, in
+    byte strings of about `chunk_size` rows each.
+    """
+    if kind not in MODELS:
+        raise ValueError('unknown kind %r, expected one of %s' % (kind, ', '.join(sorted(MODELS))))
+    if format not in FORMATS:
+        raise ValueError('unknown format %r, expected one of %s' % (format, ', '.join(FORMATS)))
+    table = MODELS[kind].__table__
+    progress = progress if progress is not None else ExportProgress()
+    chunks = _track(_chunks(_rows(session, table, since, chunk_size), chunk_size), progress)
+    if format == 'csv':
+        return _encode_csv([column.name for column in table.columns], chunks)
+    if format == 'ndjson':
+        return _encode_ndjson([column.name for column in table.columns], chunks)
+    return _encode_parquet(table, chunks)
@@ -7,7 +7,9 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m benchmarks.query_plans && python -m benchmarks.search_queries"
+            " && python -m benchmarks.workload --compare benchmarks/baseline.json --output /dev/null",
+            capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -40,7 +42,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python -m benchmarks.query_plans && heroku run python -m benchmarks.search_queries"
     )
 
 
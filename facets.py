@@ -0,0 +1,130 @@
+from collections import Counter, defaultdict
+
+from flask import request
+from sqlalchemy import String, cast, func
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from db_pool import database_key, table_stamp
+from models import Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Genre facets.
+#
+# Listings and search can be narrowed to the venues or artists that list
+# every one of a set of genres, and show how many of the rows in view list
+# each genre. On Postgres the filter is `genres @> ARRAY[...]`, answered by
+# the GIN index on the array column, and the counts come from one aggregate
+# over unnest(genres). Other databases (the SQLite test setup) use an
+# in-process inverted index instead, built from the table on first use and
+# rebuilt once the table has changed, as search.py does for names.
+#----------------------------------------------------------------------------#
+
+class GenreIndex(object):
+    """Genre -> keys of the rows listing it."""
+
+    def __init__(self, stamp=None):
+        # The table_stamp the index was built at.
+        self.stamp = stamp
+        self.genres = {}
+        self.postings = defaultdict(set)
+
+    def add(self, key, genres):
+        self.remove(key)
+        self.genres[key] = set(genres or ())
+        for genre in self.genres[key]:
+            self.postings[genre].add(key)
+
+    def remove(self, key):
+        for genre in self.genres.pop(key, ()):
+            self.postings[genre].discard(key)
+            if not self.postings[genre]:
+                del self.postings[genre]
+
+    def matching(self, genres):
+        """Keys of the rows listing every genre in `genres`."""
+        if not genres:
+            return set(self.genres)
+        postings = sorted((self.postings.get(genre, set()) for genre in genres), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def counts(self, keys):
+        counts = Counter()
+        for key in keys:
+            counts.update(self.genres.get(key, ()))
+        return counts
+
+
+# (database url, model) -> GenreIndex, for databases without array columns.
+_indexes = {}
+
+
+def _genre_index(session, model):
+    url = database_key(session.bind.url)
+    stamp = table_stamp(session, model)
+    index = _indexes.get((url, model))
+    if index is None or index.stamp != stamp:
+        index = GenreIndex(stamp=stamp)
+        for key, genres in session.query(model.id, model.genres).filter(model.deleted_at.is_(None)):
+            index.add(key, genres)
+        _indexes[(url, model)] = index
+    return index
+
+
+def requested_genres():
+    """The ?genre= values of the current request, e.g. ?genre=Jazz&genre=Folk."""
+    return sorted(set(genre.strip() for genre in request.args.getlist('genre') if genre.strip()))
+
+
+def genre_filter(session, model, genres):
+    """SQL criterion for the rows listing every genre in `genres`, or None."""
+    if not genres:
+        return None
+    if session.bind.dialect.name == 'postgresql':
+        return model.genres.op('@>')(cast(list(genres), ARRAY(String)))
+    return model.id.in_(_genre_index(session, model).matching(genres))
+
+
+def genre_counts(session, model, genres=(), *criteria, among=None):
+    """(genre, count) over the rows listing every genre in `genres` and
+    matching `criteria`, most common first. `among`, if given, further
+    limits the count to the rows with those ids.
+    """
+    if session.bind.dialect.name == 'postgresql':
+        listed = session.query(func.unnest(model.genres).label('genre')).filter(model.deleted_at.is_(None))
+        if genres:
+            listed = listed.filter(genre_filter(session, model, genres))
+        if among is not None:
+            listed = listed.filter(model.id.in_(among))
+        listed = listed.filter(*criteria).subquery()
+        count = func.count().label('count')
+        return [tuple(row) for row in session.query(listed.c.genre, count)
+                .group_by(listed.c.genre)
+                .order_by(count.desc(), listed.c.genre)]
+
+    index = _genre_index(session, model)
+    keys = index.matching(genres)
+    if among is not None:
+        keys &= set(among)
+    if criteria:
+        keys &= set(key for key, in session.query(model.id).filter(*criteria))
+    return sorted(index.counts(keys).items(), key=lambda item: (-item[1], item[0]))
+
+
+def facet_links(counts, selected):
+    """Template data for a facet list: each genre with its count, whether it
+    is selected, and the genre selection a click on it leads to.
+    """
+    selected = set(selected)
+    counted = dict(counts)
+    facets = []
+    # A selected genre stays listed even when nothing matches any more, so
+    # that it can be cleared.
+    for genre, count in list(counts) + [(genre, 0) for genre in sorted(selected) if genre not in counted]:
+        facets.append({
+            "genre": genre,
+            "count": count,
+            "selected": genre in selected,
+            "genres": sorted(selected ^ {genre})
+        })
+    return facets
+
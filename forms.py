@@ -1,9 +1,11 @@
 from datetime import datetime
-from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp
+from flask_wtf import FlaskForm
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Regexp, NumberRange, Optional
 
-class ShowForm(Form):
+from models import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+
+class ShowForm(FlaskForm):
     artist_id = StringField(
         'artist_id'
     )
@@ -15,10 +17,16 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # Minutes the show books the venue and the artist for.
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=int(MAX_SHOW_DURATION.total_seconds() // 60))],
+        default=int(DEFAULT_SHOW_DURATION.total_seconds() // 60)
+    )
     
 
 
-class VenueForm(Form):
+class VenueForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -130,7 +138,7 @@ class VenueForm(Form):
 
 
 
-class ArtistForm(Form):
+class ArtistForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -0,0 +1,163 @@
+import heapq
+import itertools
+import math
+
+from sqlalchemy import Float, and_, func, or_
+
+from db_pool import database_key, table_stamp
+from models import Venue
+
+#----------------------------------------------------------------------------#
+# Nearest venues.
+#
+# Venues with coordinates (see geocoding) can be listed nearest first from
+# any point. Positions are compared as points on a sphere in 3-d space, the
+# model of Postgres' earthdistance extension: the straight-line distance
+# between two such points orders them exactly as the great-circle distance
+# does, and a plain spatial index can answer it. On Postgres that is the
+# GiST index on ll_to_earth(latitude, longitude), walked nearest first by
+# ORDER BY ... <-> ...; other databases (the SQLite test setup) use an
+# in-process k-d tree over the same points, built on first use and rebuilt
+# once the venues table has changed, in this process or any other: every
+# change bumps a venue's updated_at, so the table's latest updated_at and
+# row count stamp the index. Pages are addressed by keyset cursors over
+# (distance, id).
+#----------------------------------------------------------------------------#
+
+# Metres, earthdistance's earth().
+EARTH_RADIUS = 6378168.0
+
+METRES_PER_MILE = 1609.344
+
+
+def to_point(latitude, longitude):
+    """(x, y, z) in metres of a position, as ll_to_earth() computes it."""
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    return (EARTH_RADIUS * math.cos(lat) * math.cos(lng),
+            EARTH_RADIUS * math.cos(lat) * math.sin(lng),
+            EARTH_RADIUS * math.sin(lat))
+
+
+def great_circle(chord):
+    """Metres along the earth between two points `chord` metres apart."""
+    return 2 * EARTH_RADIUS * math.asin(min(chord / (2 * EARTH_RADIUS), 1.0))
+
+
+def encode_cursor(chord, venue_id):
+    return '%r_%d' % (chord, venue_id)
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    chord, _, venue_id = cursor.partition('_')
+    return float(chord), int(venue_id)
+
+
+class KDTree(object):
+    """Static 3-d tree over (point, key) pairs."""
+
+    def __init__(self, items):
+        self.root = self._build(list(items), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        middle = len(items) // 2
+        return (items[middle], axis,
+                self._build(items[:middle], depth + 1),
+                self._build(items[middle + 1:], depth + 1))
+
+    def nearest(self, point):
+        """Yield (distance, key) for every item, nearest first and equally
+        near ones by key.
+
+        Best-first search: a heap holds items by their distance and subtrees
+        by a lower bound on theirs, and an item is yielded once nothing left
+        on the heap can be nearer.
+        """
+        counter = itertools.count()
+        # (distance or bound, 0 for a subtree and 1 for an item, tie-break, subtree)
+        heap = [(0.0, 0, next(counter), self.root)] if self.root is not None else []
+        while heap:
+            distance, is_item, key, node = heapq.heappop(heap)
+            if is_item:
+                yield distance, key
+                continue
+            (item_point, item_key), axis, low, high = node
+            heapq.heappush(heap, (math.dist(point, item_point), 1, item_key, None))
+            offset = point[axis] - item_point[axis]
+            near, far = (low, high) if offset < 0 else (high, low)
+            if near is not None:
+                heapq.heappush(heap, (distance, 0, next(counter), near))
+            if far is not None:
+                heapq.heappush(heap, (max(distance, abs(offset)), 0, next(counter), far))
+
+
+class LocationIndex(object):
+    """Key -> point, searched through a k-d tree, as of `stamp`."""
+
+    def __init__(self, locations, stamp):
+        self.stamp = stamp
+        self.tree = KDTree((to_point(latitude, longitude), key) for key, latitude, longitude in locations)
+
+    def nearest(self, point):
+        return self.tree.nearest(point)
+
+
+# Database url -> LocationIndex, for databases without earthdistance.
+_indexes = {}
+
+
+def _location_index(session):
+    url = database_key(session.bind.url)
+    stamp = table_stamp(session, Venue)
+    index = _indexes.get(url)
+    if index is None or index.stamp != stamp:
+        # Soft-deleted and unplaced venues are never near anything.
+        index = _indexes[url] = LocationIndex(session.query(Venue.id, Venue.latitude, Venue.longitude).filter(
+            Venue.deleted_at.is_(None), Venue.latitude.isnot(None), Venue.longitude.isnot(None)), stamp)
+    return index
+
+
+_COLUMNS = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.latitude, Venue.longitude)
+
+
+def nearest_venues(session, latitude, longitude, per_page, after=None):
+    """One page of venues, nearest to (latitude, longitude) first.
+
+    `after` is the cursor of the previous page. Returns ``{"venues": [...],
+    "next": cursor}``, each venue a dict of its columns plus "distance", in
+    metres along the earth; the cursor is None on the last page.
+    """
+    if session.bind.dialect.name == 'postgresql':
+        here = func.ll_to_earth(latitude, longitude)
+        chord = func.ll_to_earth(Venue.latitude, Venue.longitude).op('<->', return_type=Float)(here)
+        query = session.query(*_COLUMNS, chord.label('chord')) \
+            .filter(Venue.deleted_at.is_(None), Venue.latitude.isnot(None), Venue.longitude.isnot(None))
+        if after is not None:
+            query = query.filter(or_(chord > after[0], and_(chord == after[0], Venue.id > after[1])))
+        found = [(row.chord, row) for row in query.order_by(chord, Venue.id).limit(per_page + 1)]
+    else:
+        hits = itertools.dropwhile(lambda hit: after is not None and hit <= after,
+                                   _location_index(session).nearest(to_point(latitude, longitude)))
+        hits = list(itertools.islice(hits, per_page + 1))
+        rows = dict((row.id, row) for row in session.query(*_COLUMNS).filter(Venue.id.in_([key for chord, key in hits])))
+        found = [(chord, rows[key]) for chord, key in hits if key in rows]
+
+    page = found[:per_page]
+    return {
+        "venues": [{
+            "id": row.id,
+            "name": row.name,
+            "city": row.city,
+            "state": row.state,
+            "address": row.address,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "distance": great_circle(chord)
+        } for chord, row in page],
+        "next": encode_cursor(page[-1][0], page[-1][1].id) if len(found) > per_page else None
+    }
+
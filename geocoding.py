@@ -0,0 +1,119 @@
+import csv
+import re
+from functools import lru_cache
+
+from flask import current_app, request
+from sqlalchemy import bindparam, update
+
+from models import Venue
+
+#----------------------------------------------------------------------------#
+# Offline geocoding.
+#
+# Venues are placed at the coordinates of their city, looked up by city and
+# state in a local table (GEOCODING_PLACES_FILE, a CSV of city, state,
+# latitude and longitude); no geocoding service is called. New venues and
+# venues that move city are placed as they are saved, and `flask geocode`
+# places the rest in batches, e.g. after an import. A city missing from the
+# table leaves the venue without coordinates, and out of nearest-venue
+# search, until the table lists it.
+#----------------------------------------------------------------------------#
+
+def _place_key(city, state):
+    # "St. Louis", "st louis" and "Saint Louis" are the same place.
+    city = re.sub(r'\s+', ' ', (city or '').replace('.', ' ')).strip().casefold()
+    city = re.sub(r'^saint ', 'st ', city)
+    return city, (state or '').strip().upper()
+
+
+class Places(object):
+    """(city, state) -> (latitude, longitude)."""
+
+    def __init__(self, rows=()):
+        self.coordinates = {}
+        for city, state, latitude, longitude in rows:
+            self.coordinates[_place_key(city, state)] = (float(latitude), float(longitude))
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls((row['city'], row['state'], row['latitude'], row['longitude']) for row in csv.DictReader(f))
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def locate(self, city, state):
+        """(latitude, longitude) of the city, or None if the table lacks it."""
+        return self.coordinates.get(_place_key(city, state))
+
+
+@lru_cache(maxsize=None)
+def _load(path):
+    return Places.from_csv(path)
+
+
+def places():
+    """The current application's lookup table, read once per process."""
+    return _load(current_app.config['GEOCODING_PLACES_FILE'])
+
+
+def requested_position(places):
+    """(latitude, longitude) the current request searches from: ?lat= and
+    ?lng=, or else the city of ?city= and ?state=. None when it names no
+    position; raises ValueError when it names an invalid or unknown one.
+    """
+    args = request.args
+    if args.get('lat') or args.get('lng'):
+        try:
+            latitude, longitude = float(args.get('lat', '')), float(args.get('lng', ''))
+        except ValueError:
+            raise ValueError('lat and lng must both be given, in decimal degrees')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('lat must be within -90..90 and lng within -180..180')
+        return latitude, longitude
+    if args.get('city', '').strip():
+        position = places.locate(args['city'], args.get('state'))
+        if position is None:
+            raise ValueError('unknown place: %s, %s' % (args['city'].strip(), args.get('state', '').strip()))
+        return position
+    return None
+
+
+def place(venue, places):
+    """Set `venue`'s coordinates from its city and state; unknown cities
+    clear them."""
+    venue.latitude, venue.longitude = places.locate(venue.city, venue.state) or (None, None)
+
+
+def geocode_venues(session, places, batch_size=1000, everything=False):
+    """Place the venues without coordinates (`everything`: all venues) from
+    `places`, committing every `batch_size` venues.
+
+    Returns (venues placed, {(city, state): venues} for the cities the table
+    lacks).
+    """
+    table = Venue.__table__
+    statement = update(table).where(table.c.id == bindparam('v_id')) \
+        .values(latitude=bindparam('v_latitude'), longitude=bindparam('v_longitude'))
+    placed, unknown = 0, {}
+    last_id = 0
+    while True:
+        query = session.query(Venue.id, Venue.city, Venue.state) \
+            .filter(Venue.deleted_at.is_(None), Venue.id > last_id)
+        if not everything:
+            query = query.filter(Venue.latitude.is_(None))
+        rows = query.order_by(Venue.id).limit(batch_size).all()
+        if not rows:
+            return placed, unknown
+        last_id = rows[-1].id
+        located = []
+        for venue_id, city, state in rows:
+            coordinates = places.locate(city, state)
+            if coordinates is None:
+                unknown[city, state] = unknown.get((city, state), 0) + 1
+            else:
+                located.append({"v_id": venue_id, "v_latitude": coordinates[0], "v_longitude": coordinates[1]})
+        if located:
+            session.execute(statement, located)
+        session.commit()
+        placed += len(located)
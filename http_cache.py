@@ -0,0 +1,171 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import func
+from werkzeug.http import is_resource_modified
+from werkzeug.wrappers import Response
+
+from models import Venue, Artist, Show, ShowCountRollover
+from queries import current_time, is_past
+from show_calendar import requested_show_filters, requested_month
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#
+# Each cacheable route has a validator function that reads a few version
+# stamps -- updated_at of the entities on the page, the newest show that has
+# already started -- with small indexed aggregates. They are hashed into a strong ETag
+# and the newest stamp becomes Last-Modified, so a revalidating browser or CDN
+# gets a 304 without the page being queried for or rendered.
+#----------------------------------------------------------------------------#
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _newest(*stamps):
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+def _utc(local):
+    # Start times are local wall-clock times; updated_at stamps are UTC.
+    if local is not None:
+        local = local.astimezone(timezone.utc).replace(tzinfo=None)
+    return local
+
+
+def _last_started_show(session, *criteria):
+    # The upcoming/past split moves whenever a show starts, so the most
+    # recent start time is a version stamp for every page that shows it.
+    return _utc(session.query(func.max(Show.start_time)).filter(is_past(current_time()), *criteria).scalar())
+
+
+def _counters_rolled_at(session):
+    # Listings show the show_counts counters, whose upcoming/past split
+    # only moves when the rollover job runs.
+    return _utc(session.query(ShowCountRollover.rolled_at).scalar())
+
+
+def venues_validators(session):
+    updated_at, venue_count = session.query(func.max(Venue.updated_at), func.count(Venue.id)).one()
+    rolled_at = _counters_rolled_at(session)
+    return _etag('venues', updated_at, venue_count, rolled_at), _newest(updated_at, rolled_at)
+
+
+def artists_validators(session):
+    updated_at, artist_count = session.query(func.max(Artist.updated_at), func.count(Artist.id)).one()
+    return _etag('artists', updated_at, artist_count), updated_at
+
+
+def artists_with_shows_validators(session):
+    # For artist listings that also show the upcoming-show counters.
+    updated_at, artist_count = session.query(func.max(Artist.updated_at), func.count(Artist.id)).one()
+    rolled_at = _counters_rolled_at(session)
+    return _etag('artists', updated_at, artist_count, rolled_at), _newest(updated_at, rolled_at)
+
+
+def shows_validators(session):
+    # The calendar month defaults to the current one, so it is part of the
+    # version too; a malformed query string is left for the view to reject.
+    try:
+        month = requested_month(requested_show_filters(), current_time())
+    except ValueError:
+        return None, None
+    last_show_id = session.query(func.max(Show.id)).scalar()
+    venues_updated_at, venue_count = session.query(func.max(Venue.updated_at), func.count(Venue.id)).one()
+    artists_updated_at = session.query(func.max(Artist.updated_at)).scalar()
+    last_started = _last_started_show(session)
+    return (_etag('shows', month, last_show_id, venues_updated_at, venue_count, artists_updated_at, last_started),
+            _newest(venues_updated_at, artists_updated_at, last_started))
+
+
+def venue_validators(session, venue_id):
+    updated_at = session.query(Venue.updated_at).filter(Venue.id == venue_id).scalar()
+    if updated_at is None:
+        return None, None
+    artists_updated_at = session.query(func.max(Artist.updated_at)) \
+        .join(Show, Show.artist_id == Artist.id) \
+        .filter(Show.venue_id == venue_id) \
+        .scalar()
+    last_started = _last_started_show(session, Show.venue_id == venue_id)
+    return (_etag('venue', venue_id, updated_at, artists_updated_at, last_started),
+            _newest(updated_at, artists_updated_at, last_started))
+
+
+def artist_validators(session, artist_id):
+    updated_at = session.query(Artist.updated_at).filter(Artist.id == artist_id).scalar()
+    if updated_at is None:
+        return None, None
+    venues_updated_at = session.query(func.max(Venue.updated_at)) \
+        .join(Show, Show.venue_id == Venue.id) \
+        .filter(Show.artist_id == artist_id) \
+        .scalar()
+    last_started = _last_started_show(session, Show.artist_id == artist_id)
+    return (_etag('artist', artist_id, updated_at, venues_updated_at, last_started),
+            _newest(updated_at, venues_updated_at, last_started))
+
+
+def _personal(response):
+    response.cache_control.no_store = True
+    return response
+
+
+def _validated(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = current_app.config['HTTP_CACHE_CONTROL'].get(
+        request.endpoint, 'no-cache')
+    return response
+
+
+def conditional(db_session, validators):
+    """Answer conditional GETs for a view from `validators(db_session, **view_args)`.
+
+    `validators` returns (etag, last_modified), or (None, None) when the view
+    should run unconditionally (e.g. the entity does not exist). Responses
+    carrying flashed messages are personal and never cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if '_flashes' in session:
+                return _personal(make_response(view(**kwargs)))
+
+            etag, last_modified = validators(db_session, **kwargs)
+            if etag is None:
+                return view(**kwargs)
+
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(view(**kwargs))
+            else:
+                response = Response(status=304)
+            return _validated(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def async_conditional(async_db, validators):
+    """conditional() for async views: the validators run through
+    `async_db.run_sync` and the view is awaited.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(**kwargs):
+            if '_flashes' in session:
+                return _personal(make_response(await view(**kwargs)))
+
+            etag, last_modified = await async_db.run_sync(validators, **kwargs)
+            if etag is None:
+                return await view(**kwargs)
+
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(await view(**kwargs))
+            else:
+                response = Response(status=304)
+            return _validated(response, etag, last_modified)
+        return wrapper
+    return decorator
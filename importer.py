@@ -0,0 +1,317 @@
+import codecs
+import csv
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+
+from bookings import batch_conflicts
+from cache import venue_key, artist_key
+from forms import VenueForm, ArtistForm, ShowForm
+from models import Venue, Artist, Show, DEFAULT_SHOW_DURATION
+import show_calendar
+import show_counts
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Venues, artists and shows are read from CSV or NDJSON one record at a time,
+# validated with the same forms as the create pages and written in batches:
+# one executemany() INSERT per batch (psycopg2 sends it as multi-row VALUES)
+# and one lookup per batch for the artists and venues that shows refer to,
+# and for the bookings that new shows could clash with. Rows that fail
+# validation, reference resolution or the booking check are reported with
+# their line number and skipped; the rest of the batch is still written.
+#----------------------------------------------------------------------------#
+
+FORMATS = ('csv', 'ndjson')
+
+# CSV cells holding several genres separate them with this.
+GENRE_SEPARATOR = ';'
+
+# Spellings of false for BooleanField, which counts any non-empty value as true.
+_FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n', 'off')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the format from a file name or MIME type, defaulting to CSV."""
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if content_type and ('ndjson' in content_type or 'json' in content_type):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_records(stream, format):
+    """Yield (line number, record dict) from a binary stream, one at a time."""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif format == 'ndjson':
+        for line_num, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+                continue
+            yield line_num, record if isinstance(record, dict) else ValueError('expected a JSON object')
+    else:
+        raise ImportFormatError('unknown format %r, expected one of %s' % (format, ', '.join(FORMATS)))
+
+
+def _formdata(record, boolean_fields):
+    """The MultiDict a browser would have posted for `record`."""
+    formdata = MultiDict()
+    for name, value in record.items():
+        if name is None or value is None:
+            continue
+        if name in boolean_fields:
+            if str(value).strip().lower() not in _FALSE_VALUES:
+                formdata.add(name, 'y')
+        elif name == 'genres':
+            values = value if isinstance(value, list) else str(value).split(GENRE_SEPARATOR)
+            for genre in values:
+                if str(genre).strip():
+                    formdata.add(name, str(genre).strip())
+        else:
+            formdata.add(name, str(value).strip())
+    return formdata
+
+
+def _show_values(values):
+    # Shows are stored with the end of their booking, not its length.
+    duration = values.pop('duration')
+    values['end_time'] = values['start_time'] + (timedelta(minutes=duration) if duration else DEFAULT_SHOW_DURATION)
+    return values
+
+
+class _Kind(object):
+
+    def __init__(self, model, form_class, boolean_fields=(), references=(), to_values=None):
+        self.model = model
+        self.form_class = form_class
+        self.boolean_fields = boolean_fields
+        # Prefixes of the <prefix>_id / <prefix>_name columns naming other rows.
+        self.references = references
+        self.to_values = to_values
+
+    def validate(self, record):
+        """Return (values, None) for a valid record or (None, errors)."""
+        form = self.form_class(formdata=_formdata(record, self.boolean_fields), meta={'csrf': False})
+        if not form.validate():
+            return None, form.errors
+        return (self.to_values(form.data) if self.to_values else form.data), None
+
+
+KINDS = {
+    'venues': _Kind(Venue, VenueForm, ('seeking_talent',)),
+    'artists': _Kind(Artist, ArtistForm, ('seeking_venue',)),
+    'shows': _Kind(Show, ShowForm, references=('venue', 'artist'), to_values=_show_values),
+}
+
+
+class ImportReport(object):
+
+    def __init__(self, kind, max_errors):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "errors": errors})
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+
+def _resolve(session, model, ids, names):
+    """Map the referenced ids and names to existing ids, in two queries at most.
+    Soft-deleted rows do not exist here.
+
+    A name that matches more than one row maps to None (ambiguous).
+    """
+    found_ids, by_name = set(), {}
+    if ids:
+        found_ids = set(id for id, in session.query(model.id).filter(model.id.in_(ids), model.deleted_at.is_(None)))
+    if names:
+        for name, id in session.query(model.name, model.id).filter(model.name.in_(names), model.deleted_at.is_(None)):
+            by_name[name] = None if name in by_name else id
+    return found_ids, by_name
+
+
+def _reference(record, prefix, found_ids, by_name):
+    """Return (id, None) for the show's artist or venue, or (None, error)."""
+    value = record.get(prefix + '_id')
+    if value not in (None, ''):
+        try:
+            id = int(value)
+        except (TypeError, ValueError):
+            return None, 'not a number'
+        return (id, None) if id in found_ids else (None, 'no such %s' % prefix)
+    name = record.get(prefix + '_name')
+    if name in (None, ''):
+        return None, 'give %s_id or %s_name' % (prefix, prefix)
+    if name not in by_name:
+        return None, 'no %s named %r' % (prefix, name)
+    if by_name[name] is None:
+        return None, 'more than one %s named %r, use %s_id' % (prefix, name, prefix)
+    return by_name[name], None
+
+
+def _reference_keys(rows, prefix):
+    ids, names = set(), set()
+    for line, record, values in rows:
+        value = record.get(prefix + '_id')
+        if value not in (None, ''):
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+        elif record.get(prefix + '_name'):
+            names.add(record[prefix + '_name'])
+    return ids, names
+
+
+_REFERENCED_MODELS = {'venue': Venue, 'artist': Artist}
+
+
+def _resolve_references(session, kind, rows, report):
+    """Set the referenced ids on a batch of validated rows, reporting and
+    dropping the rows whose references do not resolve.
+    """
+    lookups = dict((prefix, _resolve(session, _REFERENCED_MODELS[prefix], *_reference_keys(rows, prefix)))
+                   for prefix in kind.references)
+    resolved = []
+    for line, record, values in rows:
+        errors = {}
+        for prefix in kind.references:
+            id, error = _reference(record, prefix, *lookups[prefix])
+            if error:
+                errors[prefix] = [error]
+            else:
+                values[prefix + '_id'] = id
+        if errors:
+            report.error(line, errors)
+        else:
+            resolved.append((line, values))
+    return resolved
+
+
+def _check_bookings(session, rows, report):
+    """Drop, and report, the shows whose venue or artist is already booked,
+    whether by a show in the database or by an earlier row of the batch.
+    """
+    found = batch_conflicts(session, [(values['venue_id'], values['artist_id'], values['start_time'], values['end_time'])
+                                      for line, values in rows])
+    available = []
+    for (line, values), conflict in zip(rows, found):
+        if conflict is None:
+            available.append((line, values))
+        else:
+            report.error(line, {"booking": [str(conflict)]})
+    return available
+
+
+def _insert(session, kind, rows):
+    if kind.model is not Show:
+        # The batch shares one updated_at, by which its new ids are read
+        # back from the index, to drop anything cached under them as
+        # create_venue does.
+        updated_at = datetime.utcnow()
+        session.execute(kind.model.__table__.insert(), [dict(values, updated_at=updated_at) for line, values in rows])
+        key = venue_key if kind.model is Venue else artist_key
+        return [key(id) for id, in session.query(kind.model.id).filter(kind.model.updated_at == updated_at)]
+    session.execute(kind.model.__table__.insert(), [values for line, values in rows])
+    # As in create_show_submission: count the shows, which also bumps their
+    # venues' and artists' updated_at, and drop those pages.
+    shows = [(values['venue_id'], values['artist_id'], values['start_time']) for line, values in rows]
+    show_counts.add_shows(session, shows)
+    show_calendar.add_shows(session, shows)
+    venue_ids = set(values['venue_id'] for line, values in rows)
+    artist_ids = set(values['artist_id'] for line, values in rows)
+    return [venue_key(id) for id in venue_ids] + [artist_key(id) for id in artist_ids]
+
+
+def _write_batch(session, kind, batch, report, invalidate):
+    rows = []
+    for line, record in batch:
+        values, errors = kind.validate(record)
+        if errors:
+            report.error(line, errors)
+        else:
+            rows.append((line, record, values))
+    if kind.references:
+        rows = _resolve_references(session, kind, rows, report)
+        if kind.model is Show:
+            rows = _check_bookings(session, rows, report)
+    else:
+        rows = [(line, values) for line, record, values in rows]
+    if not rows:
+        session.rollback()
+        return
+
+    try:
+        stale_keys = _insert(session, kind, rows)
+        session.commit()
+    except SQLAlchemyError:
+        # Something in the batch broke a constraint: write the rows one by
+        # one so that only the offending ones are lost.
+        session.rollback()
+        stale_keys = []
+        for line, values in rows:
+            try:
+                stale_keys += _insert(session, kind, [(line, values)])
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                report.error(line, {"database": [str(e.orig if hasattr(e, 'orig') else e).strip()]})
+                continue
+            report.inserted += 1
+    else:
+        report.inserted += len(rows)
+    if stale_keys and invalidate is not None:
+        invalidate(stale_keys)
+
+
+def import_records(session, kind, stream, format='csv', batch_size=1000, max_errors=1000, invalidate=None):
+    """Import every record in `stream` as `kind` ('venues', 'artists' or 'shows').
+
+    `invalidate` is called with the page cache keys of each committed batch.
+    Returns an ImportReport; only a bad `kind` or `format` raises.
+    """
+    if kind not in KINDS:
+        raise ImportFormatError('unknown kind %r, expected one of %s' % (kind, ', '.join(sorted(KINDS))))
+    if format not in FORMATS:
+        raise ImportFormatError('unknown format %r, expected one of %s' % (format, ', '.join(FORMATS)))
+    report = ImportReport(kind, max_errors)
+    batch = []
+    for line, record in read_records(stream, format):
+        if isinstance(record, Exception):
+            report.error(line, {"record": [str(record)]})
+            continue
+        batch.append((line, record))
+        if len(batch) >= batch_size:
+            _write_batch(session, KINDS[kind], batch, report, invalidate)
+            batch = []
+    if batch:
+        _write_batch(session, KINDS[kind], batch, report, invalidate)
+    return report
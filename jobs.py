@@ -0,0 +1,323 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import db, Job
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#
+# Work that need not be done before the response goes out is enqueued as a
+# row of the jobs table in the transaction of the write that calls for it,
+# so it commits or rolls back with that write and outlives the process that
+# enqueued it. Worker threads in each server process (or `flask jobs work`
+# on its own) claim due jobs, on Postgres with SELECT ... FOR UPDATE SKIP
+# LOCKED so that workers never wait on each other, and failed jobs are
+# retried with exponential backoff up to max_attempts. A job running for
+# longer than JOBS_LEASE is taken to have lost its worker and is requeued.
+# A job with an idempotency key is enqueued at most once per key, which is
+# also how every process can schedule the periodic tasks of JOBS_SCHEDULE
+# without doubling them up.
+#----------------------------------------------------------------------------#
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# How often each process requeues abandoned jobs and prunes finished ones.
+HOUSEKEEPING_INTERVAL = timedelta(minutes=1)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _worker_id(index=0):
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), index)
+
+
+def _insert(session, values):
+    # Drops the row when its idempotency key is taken. Other databases raise
+    # IntegrityError on a duplicate key instead.
+    dialect = session.bind.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(Job.__table__).values(**values).on_conflict_do_nothing(index_elements=['key'])
+    if dialect == 'sqlite':
+        return sqlite.insert(Job.__table__).values(**values).on_conflict_do_nothing(index_elements=['key'])
+    return Job.__table__.insert().values(**values)
+
+
+def _claim(session, worker_id):
+    """Mark the oldest due job as running for `worker_id` and commit.
+    Returns (id, task, payload, attempts, max_attempts), or None.
+    """
+    now = datetime.utcnow()
+    while True:
+        job_id = session.query(Job.id) \
+            .filter(Job.state == QUEUED, Job.run_at <= now) \
+            .order_by(Job.run_at, Job.id) \
+            .limit(1) \
+            .with_for_update(skip_locked=True) \
+            .scalar()
+        if job_id is None:
+            session.rollback()
+            return None
+        # Without row locks (SQLite) two workers can pick the same job; the
+        # state check lets only one of them have it.
+        claimed = session.query(Job).filter(Job.id == job_id, Job.state == QUEUED).update({
+            Job.state: RUNNING,
+            Job.locked_by: worker_id,
+            Job.locked_at: now,
+            Job.attempts: Job.attempts + 1
+        }, synchronize_session=False)
+        session.commit()
+        if claimed:
+            return session.query(Job.id, Job.task, Job.payload, Job.attempts, Job.max_attempts) \
+                .filter(Job.id == job_id).one()
+
+
+def _settle(session, job_id, worker_id, **values):
+    # Only the worker holding the job settles it: once its lease ran out the
+    # job may have gone to another worker.
+    values.update(locked_by=None, locked_at=None)
+    session.query(Job).filter(Job.id == job_id, Job.state == RUNNING, Job.locked_by == worker_id) \
+        .update(values, synchronize_session=False)
+    session.commit()
+
+
+class _JobsState(object):
+
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config.get('JOBS_WORKERS', 0)
+        self.poll_interval = app.config.get('JOBS_POLL_INTERVAL', 1.0)
+        self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', 5)
+        self.retry_delay = timedelta(seconds=app.config.get('JOBS_RETRY_DELAY', 10))
+        self.lease = timedelta(seconds=app.config.get('JOBS_LEASE', 300))
+        self.keep_finished = timedelta(seconds=app.config.get('JOBS_KEEP_FINISHED', 86400))
+        self.schedule = dict(app.config.get('JOBS_SCHEDULE', {}))
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.pid = None
+        # Period of each scheduled task this process last enqueued.
+        self.scheduled = {}
+        self.housekept_at = None
+        self.metrics = dict((name, Counter()) for name in ('enqueued', 'duplicates', 'succeeded', 'retried', 'failed', 'run_seconds'))
+
+    def count(self, metric, task, amount=1):
+        with self.lock:
+            self.metrics[metric][task] += amount
+
+
+class JobQueue(object):
+    """Flask extension running registered tasks off the request path."""
+
+    def __init__(self, app=None):
+        self.tasks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['jobs'] = _JobsState(app)
+        # Each server process starts its workers with its first request, so
+        # none is started in a parent that then forks.
+        if app.config.get('JOBS_WORKERS', 0) and not app.testing:
+            app.before_request(self.start)
+
+    def _state(self, app=None):
+        return (app or current_app).extensions['jobs']
+
+    def task(self, name):
+        """Register the decorated function as the task `name`. It is called
+        with the job's payload as keyword arguments, in an application
+        context, and may be run more than once.
+        """
+        def register(fn):
+            self.tasks[name] = fn
+            return fn
+        return register
+
+    def enqueue(self, session, task, payload=None, key=None, delay=None, max_attempts=None):
+        """Add a `task` job to `session`'s transaction; workers see it once
+        that commits. Nothing is added if a job with this idempotency `key`
+        is still kept. `delay` (a timedelta) postpones the first run.
+        """
+        if task not in self.tasks:
+            raise KeyError('no such task: %s' % task)
+        state = self._state()
+        now = datetime.utcnow()
+        result = session.execute(_insert(session, {
+            "task": task,
+            "key": key,
+            "payload": payload or {},
+            "state": QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts or state.max_attempts,
+            "run_at": now + (delay or timedelta(0)),
+            "created_at": now
+        }))
+        if result.rowcount:
+            session.info['jobs'] = state
+            state.count('enqueued', task)
+        else:
+            state.count('duplicates', task)
+
+    def run_next(self, worker_id=None):
+        """Claim one due job and run it here. Returns False if none was due."""
+        state = self._state()
+        worker_id = worker_id or _worker_id()
+        job = _claim(db.session, worker_id)
+        if job is None:
+            return False
+
+        started = time.perf_counter()
+        try:
+            self.tasks[job.task](**job.payload)
+        except Exception as e:
+            db.session.rollback()
+            error = traceback.format_exc()
+            now = datetime.utcnow()
+            if job.attempts >= job.max_attempts or job.task not in self.tasks:
+                state.app.logger.error('job %d (%s) failed for good: %s', job.id, job.task, e)
+                _settle(db.session, job.id, worker_id, state=FAILED, finished_at=now, last_error=error)
+                state.count('failed', job.task)
+            else:
+                retry_at = now + state.retry_delay * 2 ** (job.attempts - 1)
+                _settle(db.session, job.id, worker_id, state=QUEUED, run_at=retry_at, last_error=error)
+                state.count('retried', job.task)
+        else:
+            db.session.rollback()
+            _settle(db.session, job.id, worker_id, state=DONE, finished_at=datetime.utcnow())
+            state.count('succeeded', job.task)
+        finally:
+            state.count('run_seconds', job.task, time.perf_counter() - started)
+        return True
+
+    def run_pending(self, limit=None):
+        """Run due jobs in this thread until none is left, or `limit` have
+        run. Returns how many ran.
+        """
+        ran = 0
+        while (limit is None or ran < limit) and self.run_next():
+            ran += 1
+        return ran
+
+    def tick(self, now=None):
+        """Enqueue the scheduled tasks that are due. Every
+        HOUSEKEEPING_INTERVAL, also requeue the jobs that have been running
+        for longer than JOBS_LEASE, whose worker is taken to be gone (failing
+        those out of attempts), and drop old finished jobs.
+        """
+        state = self._state()
+        now = now or datetime.utcnow()
+        seconds = (now - _EPOCH).total_seconds()
+        for task, every in state.schedule.items():
+            period = int(seconds // every)
+            if state.scheduled.get(task) != period:
+                self.enqueue(db.session, task, key='%s@%d' % (task, period))
+                state.scheduled[task] = period
+
+        if state.housekept_at is None or now - state.housekept_at >= HOUSEKEEPING_INTERVAL:
+            abandoned = (Job.state == RUNNING, Job.locked_at < now - state.lease)
+            db.session.query(Job).filter(*abandoned).filter(Job.attempts >= Job.max_attempts).update({
+                Job.state: FAILED, Job.finished_at: now, Job.locked_by: None, Job.last_error: 'worker lost'
+            }, synchronize_session=False)
+            db.session.query(Job).filter(*abandoned).update({
+                Job.state: QUEUED, Job.locked_by: None, Job.locked_at: None
+            }, synchronize_session=False)
+            db.session.query(Job).filter(Job.state.in_([DONE, FAILED]), Job.finished_at < now - state.keep_finished) \
+                .delete(synchronize_session=False)
+            state.housekept_at = now
+        db.session.commit()
+
+    def start(self, app=None, workers=None):
+        """Start this process's worker threads and scheduler thread, once
+        per process. `workers` overrides JOBS_WORKERS.
+        """
+        state = self._state(app)
+        if state.pid == os.getpid():
+            return
+        with state.lock:
+            if state.pid == os.getpid():
+                return
+            state.stopping.clear()
+            count = state.workers if workers is None else workers
+            state.threads = [threading.Thread(target=self._work, args=(state, _worker_id(i)),
+                                              name='jobs-worker-%d' % i, daemon=True) for i in range(count)]
+            state.threads.append(threading.Thread(target=self._schedule, args=(state,), name='jobs-scheduler', daemon=True))
+            for thread in state.threads:
+                thread.start()
+            state.pid = os.getpid()
+
+    def stop(self, app=None, timeout=None):
+        """Let the running jobs finish and stop this process's threads."""
+        state = self._state(app)
+        state.stopping.set()
+        state.wakeup.set()
+        for thread in state.threads:
+            thread.join(timeout)
+        state.threads = []
+        state.pid = None
+
+    def _work(self, state, worker_id):
+        with state.app.app_context():
+            while not state.stopping.is_set():
+                try:
+                    ran = self.run_next(worker_id)
+                except Exception:
+                    state.app.logger.exception('job worker %s', worker_id)
+                    ran = False
+                finally:
+                    db.session.remove()
+                if not ran:
+                    state.wakeup.wait(state.poll_interval)
+                    state.wakeup.clear()
+
+    def _schedule(self, state):
+        with state.app.app_context():
+            while not state.stopping.wait(state.poll_interval):
+                try:
+                    self.tick()
+                except Exception:
+                    state.app.logger.exception('job scheduler')
+                finally:
+                    db.session.remove()
+
+    def stats(self):
+        """This process's job counters by task, plus the queue's size by state
+        and how long the oldest due job has been waiting.
+        """
+        state = self._state()
+        now = datetime.utcnow()
+        with state.lock:
+            stats = dict((name, dict(counter)) for name, counter in state.metrics.items())
+        stats["workers"] = sum(1 for thread in state.threads if thread.is_alive() and thread.name != 'jobs-scheduler')
+        stats["queue"] = dict(db.session.query(Job.state, func.count(Job.id)).group_by(Job.state).all())
+        oldest = db.session.query(func.min(Job.run_at)).filter(Job.state == QUEUED, Job.run_at <= now).scalar()
+        stats["lag_seconds"] = (now - oldest).total_seconds() if oldest else 0
+        return stats
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    # Jobs enqueued in the transaction that just committed can run now.
+    state = session.info.pop('jobs', None)
+    if state is not None:
+        state.wakeup.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_jobs(session):
+    session.info.pop('jobs', None)
+
+
+# The application's job queue; create_app() binds it, app.py registers the
+# tasks.
+jobs = JobQueue()
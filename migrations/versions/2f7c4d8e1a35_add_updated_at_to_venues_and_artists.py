@@ -0,0 +1,31 @@
+"""add updated_at to venues and artists
+
+Revision ID: 2f7c4d8e1a35
+Revises: b3e1f07a92d4
+Create Date: 2026-10-18 11:26:52.037719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f7c4d8e1a35'
+down_revision = 'b3e1f07a92d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are stamped with the migration time (UTC, like the
+    # model's default); new rows get updated_at from the application.
+    for table in ('artists', 'venues'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False))
+        op.alter_column(table, 'updated_at', server_default=None)
+        op.create_index(op.f('ix_%s_updated_at' % table), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_index(op.f('ix_%s_updated_at' % table), table_name=table)
+        op.drop_column(table, 'updated_at')
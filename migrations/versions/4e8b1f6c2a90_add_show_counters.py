@@ -0,0 +1,44 @@
+"""add show counters to venues and artists
+
+Revision ID: 4e8b1f6c2a90
+Revises: 9c4e2a7f1d63
+Create Date: 2026-10-18 15:20:43.907316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8b1f6c2a90'
+down_revision = '9c4e2a7f1d63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_count_rollover',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Start times are local wall-clock times, so the split is LOCALTIMESTAMP.
+    op.execute("INSERT INTO show_count_rollover (id, rolled_at) VALUES (1, LOCALTIMESTAMP)")
+
+    for table, key in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(
+            "UPDATE {table} SET "
+            "upcoming_shows_count = (SELECT count(*) FROM shows WHERE shows.{key} = {table}.id "
+            "AND shows.start_time > (SELECT rolled_at FROM show_count_rollover)), "
+            "past_shows_count = (SELECT count(*) FROM shows WHERE shows.{key} = {table}.id "
+            "AND shows.start_time <= (SELECT rolled_at FROM show_count_rollover))".format(table=table, key=key)
+        )
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_table('show_count_rollover')
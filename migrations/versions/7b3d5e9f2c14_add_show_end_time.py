@@ -0,0 +1,52 @@
+"""add end_time to shows and refuse overlapping bookings
+
+Revision ID: 7b3d5e9f2c14
+Revises: 4e8b1f6c2a90
+Create Date: 2026-10-18 17:05:12.481930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3d5e9f2c14'
+down_revision = '4e8b1f6c2a90'
+branch_labels = None
+depends_on = None
+
+OVERLAPS = (
+    "SELECT a.id, b.id FROM shows a JOIN shows b ON a.{key} = b.{key} AND a.id < b.id "
+    "AND a.start_time < b.end_time AND b.start_time < a.end_time LIMIT 10"
+)
+
+
+def upgrade():
+    # Existing shows get the default two hours (models.DEFAULT_SHOW_DURATION).
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    op.alter_column('shows', 'end_time', nullable=False)
+    # bookings.py finds overlaps by looking back at most MAX_SHOW_DURATION.
+    op.create_check_constraint('ck_shows_duration', 'shows',
+                               "end_time > start_time AND end_time <= start_time + interval '12 hours'")
+
+    # Which of two double-booked shows is wrong is for a person to decide.
+    conn = op.get_bind()
+    for key in ('venue_id', 'artist_id'):
+        overlapping = conn.execute(sa.text(OVERLAPS.format(key=key))).fetchall()
+        if overlapping:
+            raise RuntimeError('shows with the same %s overlap, e.g. ids %s; move or shorten them first' % (
+                key, ', '.join('%d/%d' % pair for pair in overlapping)))
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute("ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_booking "
+               "EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)")
+    op.execute("ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_booking "
+               "EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)")
+
+
+def downgrade():
+    op.drop_constraint('ex_shows_artist_booking', 'shows')
+    op.drop_constraint('ex_shows_venue_booking', 'shows')
+    op.drop_constraint('ck_shows_duration', 'shows', type_='check')
+    op.drop_column('shows', 'end_time')
@@ -0,0 +1,29 @@
+"""add updated_at to shows
+
+Revision ID: 9c4e2a7f1d63
+Revises: 2f7c4d8e1a35
+Create Date: 2026-10-18 14:02:11.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e2a7f1d63'
+down_revision = '2f7c4d8e1a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Lets incremental exports pick up only the shows written since the
+    # last run; existing rows are stamped with the migration time.
+    op.add_column('shows', sa.Column('updated_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False))
+    op.alter_column('shows', 'updated_at', server_default=None)
+    op.create_index(op.f('ix_shows_updated_at'), 'shows', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_shows_updated_at'), table_name='shows')
+    op.drop_column('shows', 'updated_at')
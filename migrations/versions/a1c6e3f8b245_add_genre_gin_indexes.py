@@ -0,0 +1,26 @@
+"""add genre GIN indexes
+
+Revision ID: a1c6e3f8b245
+Revises: 7b3d5e9f2c14
+Create Date: 2026-10-18 18:21:40.517302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c6e3f8b245'
+down_revision = '7b3d5e9f2c14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_genres', 'venues', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artists_genres', 'artists', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
@@ -0,0 +1,34 @@
+"""soft-delete venues and artists
+
+Revision ID: c4f9a2d7e813
+Revises: a1c6e3f8b245
+Create Date: 2026-10-18 19:02:55.130468
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f9a2d7e813'
+down_revision = 'a1c6e3f8b245'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('artists', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_venues_live', 'venues', ['state', 'city', 'name', 'id'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+    op.create_index('ix_artists_live', 'artists', ['id'], unique=False,
+                    postgresql_where=LIVE, sqlite_where=LIVE)
+
+
+def downgrade():
+    op.drop_index('ix_artists_live', table_name='artists')
+    op.drop_index('ix_venues_live', table_name='venues')
+    op.drop_column('artists', 'deleted_at')
+    op.drop_column('venues', 'deleted_at')
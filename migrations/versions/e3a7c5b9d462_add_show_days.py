@@ -0,0 +1,39 @@
+"""add show days
+
+Revision ID: e3a7c5b9d462
+Revises: d8b2e6f1a357
+Create Date: 2026-10-18 21:12:40.518307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c5b9d462'
+down_revision = 'd8b2e6f1a357'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_days',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ),
+    sa.PrimaryKeyConstraint('day', 'venue_id')
+    )
+    op.create_index('ix_show_days_venue_id_day', 'show_days', ['venue_id', 'day'], unique=False)
+    op.create_index('ix_venues_city_state', 'venues', ['city', 'state'], unique=False)
+    # Bucket the shows already booked.
+    op.execute(
+        "INSERT INTO show_days (venue_id, day, show_count) "
+        "SELECT venue_id, date(start_time), count(id) FROM shows GROUP BY venue_id, date(start_time)"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_venues_city_state', table_name='venues')
+    op.drop_index('ix_show_days_venue_id_day', table_name='show_days')
+    op.drop_table('show_days')
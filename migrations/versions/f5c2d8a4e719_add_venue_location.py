@@ -0,0 +1,33 @@
+"""add venue location
+
+Revision ID: f5c2d8a4e719
+Revises: e3a7c5b9d462
+Create Date: 2026-10-18 22:05:17.284931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c2d8a4e719'
+down_revision = 'e3a7c5b9d462'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    # Nearest-venue search orders by distance on earthdistance's sphere
+    # (see geo.py). Existing venues are placed by `flask geocode`.
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    op.execute('CREATE INDEX ix_venues_location ON venues USING gist (ll_to_earth(latitude, longitude)) '
+               'WHERE deleted_at IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL')
+
+
+def downgrade():
+    op.drop_index('ix_venues_location', table_name='venues')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
@@ -1,7 +1,13 @@
-from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime, timedelta
 
-# TODO: connect to a local postgresql database
-db = SQLAlchemy()
+from sqlalchemy import DDL, event, func
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.schema import AddConstraint
+
+from db_pool import PooledSQLAlchemy
+
+# The application's only SQLAlchemy extension; create_app() binds it.
+db = PooledSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -9,6 +15,20 @@ db = SQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    # Trigram index for name search (requires the pg_trgm extension), and
+    # GIN index on genres for the `genres @> ...` facet filter (see facets).
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        # Listings read only the rows that are not soft-deleted.
+        db.Index('ix_venues_live', 'state', 'city', 'name', 'id',
+                 postgresql_where=db.text('deleted_at IS NULL'),
+                 sqlite_where=db.text('deleted_at IS NULL')),
+        # Show listings and calendars filtered by place; these include the
+        # past shows of deleted venues, so the index is not partial.
+        db.Index('ix_venues_city_state', 'city', 'state'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False)
     city = db.Column(db.String(120), nullable=False)
@@ -19,21 +39,51 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(db.ARRAY(db.String).with_variant(db.JSON, 'sqlite'), nullable=False)
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.Text)
+    # Where the venue's city is, set by geocoding; None until it is known.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Maintained by show_counts, split at the last rollover rather than now.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on every change to the venue or its shows; see http_cache.
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set when the venue is deleted; the row stays for the shows it had.
+    deleted_at = db.Column(db.DateTime)
     shows = db.relationship('Show', backref='venues', lazy=True)
 
+# Nearest-venue search (see geo) walks a GiST index of the venues' positions
+# on the earthdistance extension's sphere. It indexes an expression only
+# Postgres has, so it is only created there.
+event.listen(Venue.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_venues_location ON venues USING gist (ll_to_earth(latitude, longitude)) '
+    'WHERE deleted_at IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL'
+).execute_if(dialect='postgresql'))
+
 class Artist(db.Model):
     __tablename__ = 'artists'
+    # Trigram index for name search (requires the pg_trgm extension), and
+    # GIN index on genres for the `genres @> ...` facet filter (see facets).
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        # Listings read only the rows that are not soft-deleted.
+        db.Index('ix_artists_live', 'id',
+                 postgresql_where=db.text('deleted_at IS NULL'),
+                 sqlite_where=db.text('deleted_at IS NULL')),
+    )
   
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False)
+    genres = db.Column(db.ARRAY(db.String(120)).with_variant(db.JSON, 'sqlite'), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -41,15 +91,98 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.Text)
+    # Maintained by show_counts, split at the last rollover rather than now.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on every change to the artist or its shows; see http_cache.
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set when the artist is deleted; the row stays for the shows it had.
+    deleted_at = db.Column(db.DateTime)
     shows = db.relationship('Show', backref="artists", lazy=True)
 
+# How long a show books its venue and artist when no duration is given, and
+# the longest booking allowed (bookings.py relies on the bound).
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+MAX_SHOW_DURATION = timedelta(hours=12)
+
+def _default_end_time(context):
+  return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
   __tablename__ = 'shows'
+  # Every page reads shows by venue or artist within a time range.
+  __table_args__ = (
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    # bookings.py finds overlaps by looking back at most MAX_SHOW_DURATION.
+    db.CheckConstraint("end_time > start_time AND end_time <= start_time + interval '%d hours'"
+                       % (MAX_SHOW_DURATION // timedelta(hours=1)), name='ck_shows_duration'),
+    # A venue or an artist has one booking at a time (requires btree_gist).
+    ExcludeConstraint(('venue_id', '='), (func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                      name='ex_shows_venue_booking', using='gist'),
+    ExcludeConstraint(('artist_id', '='), (func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                      name='ex_shows_artist_booking', using='gist'),
+  )
   
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey(
         'artists.id'), nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id'), nullable=False)
-  start_time = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+  start_time = db.Column(db.DateTime, nullable=False, index=True)
+  # Bookings never overlap; on Postgres, exclusion constraints enforce it.
+  end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
+  # Lets exports pick up only the shows written since a given time.
+  updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                         default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# The duration check and the exclusion constraints are Postgres SQL, so they
+# are added after CREATE TABLE there and left out elsewhere, where
+# bookings.py's checks are all there is.
+for constraint in Show.__table__.constraints:
+  if constraint.name in ('ck_shows_duration', 'ex_shows_venue_booking', 'ex_shows_artist_booking'):
+    event.listen(Show.__table__, 'after_create', AddConstraint(constraint).execute_if(dialect='postgresql'))
+
+class ShowDay(db.Model):
+  __tablename__ = 'show_days'
+  # Shows per venue and calendar day of start_time, kept by show_calendar so
+  # that month views sum a few rows a day instead of counting shows.
+  __table_args__ = (
+    db.Index('ix_show_days_venue_id_day', 'venue_id', 'day'),
+  )
+
+  day = db.Column(db.Date, primary_key=True)
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), primary_key=True)
+  show_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ShowCountRollover(db.Model):
+  __tablename__ = 'show_count_rollover'
+  # A single row: the time show_counts last moved started shows to past.
+  id = db.Column(db.Integer, primary_key=True)
+  rolled_at = db.Column(db.DateTime, nullable=False)
+
+class Job(db.Model):
+  __tablename__ = 'jobs'
+  # Workers claim the oldest due job of a state; see jobs.py.
+  __table_args__ = (
+    db.Index('ix_jobs_state_run_at', 'state', 'run_at'),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  task = db.Column(db.String(120), nullable=False)
+  # Idempotency key: a second job with the same key is dropped at enqueue
+  # time for as long as the first one's row is kept.
+  key = db.Column(db.String(255), unique=True)
+  payload = db.Column(db.JSON, nullable=False, default=dict)
+  # queued -> running -> done, or back to queued to retry, or failed.
+  state = db.Column(db.String(16), nullable=False, default='queued')
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  max_attempts = db.Column(db.Integer, nullable=False)
+  run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  locked_by = db.Column(db.String(120))
+  locked_at = db.Column(db.DateTime)
+  last_error = db.Column(db.Text)
+  created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  finished_at = db.Column(db.DateTime)
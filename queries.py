@@ -0,0 +1,298 @@
+from datetime import datetime
+from itertools import groupby
+
+from flask import g, has_app_context
+from sqlalchemy import and_, or_
+
+from facets import genre_filter
+from models import Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Time partitioning.
+#----------------------------------------------------------------------------#
+
+def current_time():
+    """Return "now" for the running request.
+
+    The value is taken on first use and kept on `flask.g`, so every query a
+    view issues splits shows at the same instant. Outside an application
+    context (CLI, benchmarks) this is just datetime.now().
+    """
+    if not has_app_context():
+        return datetime.now()
+    if 'now' not in g:
+        g.now = datetime.now()
+    return g.now
+
+
+def is_upcoming(now=None):
+    """SQL predicate for shows that start after `now`."""
+    return Show.start_time > (now or current_time())
+
+
+def is_past(now=None):
+    """SQL predicate for shows that started at or before `now`."""
+    return Show.start_time <= (now or current_time())
+
+
+def partition_shows(query, now=None):
+    """Run a query over shows and split its rows into (upcoming, past).
+
+    The comparison with `now` is added to the SELECT list, so the database
+    classifies each row and nothing has to be formatted to be compared.
+    """
+    upcoming, past = [], []
+    for row in query.add_columns(is_upcoming(now).label('is_upcoming')):
+        (upcoming if row.is_upcoming else past).append(row)
+    return upcoming, past
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def venue_directory(session, genres=()):
+    """Build the /venues listing: city/state areas, each with its venues,
+    narrowed to the venues listing every genre in `genres`.
+
+    Everything comes back from one statement over venues alone: the
+    upcoming-show counts are the counters show_counts keeps on each row, so
+    the page costs a single round trip and never touches shows.
+    """
+    query = session.query(
+        Venue.city,
+        Venue.state,
+        Venue.id,
+        Venue.name,
+        Venue.updated_at,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(Venue.deleted_at.is_(None))
+    if genres:
+        query = query.filter(genre_filter(session, Venue, genres))
+    rows = query.order_by(Venue.state, Venue.city, Venue.name, Venue.id).all()
+
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        areas.append({
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": venue.id,
+                "name": venue.name,
+                "updated_at": venue.updated_at,
+                "num_upcoming_shows": venue.num_upcoming_shows
+            } for venue in venues]
+        })
+    return areas
+
+
+def artist_directory(session, genres=()):
+    """Build the /artists listing, narrowed like venue_directory."""
+    query = session.query(Artist.id, Artist.name, Artist.updated_at).filter(Artist.deleted_at.is_(None))
+    if genres:
+        query = query.filter(genre_filter(session, Artist, genres))
+    return query.order_by(Artist.id).all()
+
+
+def venue_shows(session, venue_id, now=None):
+    """Return the (upcoming, past) shows of a venue with their artists."""
+    query = session.query(
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+    ).join(Artist, Artist.id == Show.artist_id) \
+        .filter(Show.venue_id == venue_id) \
+        .order_by(Show.start_time)
+    return partition_shows(query, now)
+
+
+def artist_shows(session, artist_id, now=None):
+    """Return the (upcoming, past) shows of an artist with their venues."""
+    query = session.query(
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id) \
+        .filter(Show.artist_id == artist_id) \
+        .order_by(Show.start_time)
+    return partition_shows(query, now)
+
+
+def _show_time(show):
+    return show.start_time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def page_expiry(page):
+    """When a venue_page or artist_page dict goes stale by itself, as a
+    time.time(): the start of its first upcoming show, which then is past.
+    None for a page without upcoming shows.
+    """
+    starts = [datetime.strptime(show['start_time'], '%Y-%m-%d %H:%M:%S') for show in page['upcoming_shows']]
+    # Start times are local wall-clock times, and lose their fractions of a
+    # second here, so the page expires at or before the show starts.
+    return min(starts).timestamp() if starts else None
+
+
+def venue_page(session, venue_id, now=None):
+    """Everything the venue page shows, as a plain dict fit for caching.
+
+    Returns None when there is no such venue.
+    """
+    venue = find_venue(session, venue_id)
+    if venue is None:
+        return None
+    return build_venue_page(venue, *venue_shows(session, venue_id, now))
+
+
+def find_venue(session, venue_id):
+    return session.query(Venue).filter(Venue.id == venue_id, Venue.deleted_at.is_(None)).first()
+
+
+def build_venue_page(venue, upcoming_shows, past_shows):
+    """The venue_page dict, from the venue and its (upcoming, past) shows."""
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": venue.genres,
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website_link,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link,
+        "upcoming_shows": [{
+            "artist_id": show.artist_id,
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link,
+            "start_time": _show_time(show)
+        } for show in upcoming_shows],
+        "past_shows": [{
+            "artist_id": show.artist_id,
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link,
+            "start_time": _show_time(show)
+        } for show in past_shows],
+        "upcoming_shows_count": len(upcoming_shows),
+        "past_shows_count": len(past_shows)
+    }
+
+
+def artist_page(session, artist_id, now=None):
+    """Everything the artist page shows, as a plain dict fit for caching.
+
+    Returns None when there is no such artist.
+    """
+    artist = find_artist(session, artist_id)
+    if artist is None:
+        return None
+    return build_artist_page(artist, *artist_shows(session, artist_id, now))
+
+
+def find_artist(session, artist_id):
+    return session.query(Artist).filter(Artist.id == artist_id, Artist.deleted_at.is_(None)).first()
+
+
+def build_artist_page(artist, upcoming_shows, past_shows):
+    """The artist_page dict, from the artist and its (upcoming, past) shows."""
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": artist.genres,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website_link,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link,
+        "upcoming_shows": [{
+            "venue_id": show.venue_id,
+            "venue_name": show.venue_name,
+            "venue_image_link": show.venue_image_link,
+            "start_time": _show_time(show)
+        } for show in upcoming_shows],
+        "past_shows": [{
+            "venue_id": show.venue_id,
+            "venue_name": show.venue_name,
+            "venue_image_link": show.venue_image_link,
+            "start_time": _show_time(show)
+        } for show in past_shows],
+        "upcoming_shows_count": len(upcoming_shows),
+        "past_shows_count": len(past_shows)
+    }
+
+
+def encode_cursor(start_time, show_id):
+    """Opaque /shows page cursor for the show at (start_time, id)."""
+    return '%s_%d' % (start_time.strftime('%Y%m%dT%H%M%S%f'), show_id)
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    start_time, _, show_id = cursor.partition('_')
+    return datetime.strptime(start_time, '%Y%m%dT%H%M%S%f'), int(show_id)
+
+
+def show_listing(session, per_page, after=None, before=None, criteria=()):
+    """One page of /shows, ordered by (start_time, id), of the shows
+    matching `criteria` (see show_calendar.ShowFilters).
+
+    Pages are addressed by keyset cursors rather than offsets: `after`
+    continues past the last show of the previous page, `before` walks back
+    from the first show of the next one. Each page is one indexed range
+    read of `per_page` + 1 rows, whatever its position in the table.
+
+    Returns ``{"shows": [...], "next": cursor, "prev": cursor}`` where a
+    cursor is None when there is nothing further in that direction.
+    """
+    query = session.query(
+        Show.id,
+        Show.start_time,
+        Show.end_time,
+        Show.updated_at,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.updated_at.label('venue_updated_at'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Artist.updated_at.label('artist_updated_at')
+    ).join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .filter(*criteria)
+
+    if before is not None:
+        start_time, show_id = before
+        # The redundant >=/<= bound lets the start_time index narrow the range.
+        query = query.filter(Show.start_time <= start_time, or_(
+            Show.start_time < start_time,
+            and_(Show.start_time == start_time, Show.id < show_id)
+        )).order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        query = query.order_by(Show.start_time, Show.id)
+        if after is not None:
+            start_time, show_id = after
+            query = query.filter(Show.start_time >= start_time, or_(
+                Show.start_time > start_time,
+                and_(Show.start_time == start_time, Show.id > show_id)
+            ))
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+
+    return {
+        "shows": rows,
+        "next": encode_cursor(rows[-1].start_time, rows[-1].id) if rows and has_next else None,
+        "prev": encode_cursor(rows[0].start_time, rows[0].id) if rows and has_prev else None
+    }
@@ -0,0 +1,106 @@
+import json
+import logging
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Per-request query statistics.
+#
+# Engine cursor events attribute every statement to the request that sent
+# it: how many ran, how long the database took and how often each
+# parameterised statement repeated (the signature of an N+1 loop). The
+# totals go out as a Server-Timing header and a JSON log line; in strict
+# mode a request over its query budget raises instead.
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.queries')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestQueryStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, limit):
+        """Statements that ran more than `limit` times, most repeated first."""
+        return [(statement, count) for statement, count in self.statements.most_common() if count > limit]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_request_context() and 'query_stats' in g:
+        g.query_stats.record(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+class QueryStats(object):
+    """Flask extension that instruments every request's SQL."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.query_stats = RequestQueryStats()
+
+    def _finish(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        config = current_app.config
+        budget = config['QUERY_BUDGETS'].get(request.endpoint, config['QUERY_BUDGET'])
+        repeated = stats.repeated(config['QUERY_REPEAT_LIMIT'])
+        over_budget = stats.count > budget
+
+        response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d queries"' % (stats.duration * 1000, stats.count))
+        logger.log(logging.WARNING if over_budget or repeated else logging.DEBUG, json.dumps({
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": stats.count,
+            "db_ms": round(stats.duration * 1000, 3),
+            "budget": budget,
+            "repeated": [{"statement": ' '.join(statement.split()), "count": count} for statement, count in repeated]
+        }))
+
+        if config['QUERY_STATS_STRICT'] and (over_budget or repeated):
+            problems = []
+            if over_budget:
+                problems.append('%d queries, budget is %d' % (stats.count, budget))
+            for statement, count in repeated:
+                problems.append('ran %d times: %s' % (count, ' '.join(statement.split())))
+            raise QueryBudgetExceeded('%s %s: %s' % (request.method, request.path, '; '.join(problems)))
+        return response
@@ -0,0 +1,204 @@
+import itertools
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import create_engine, event, func, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from db_pool import engine_options, dispose_engine_after_fork
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#
+# Views decorated with @replicas.reads run their queries on one of the
+# DATABASE_REPLICA_URLS, taken in turn, instead of the primary. A replica
+# further behind than REPLICA_MAX_LAG seconds is passed over, and when every
+# replica is, reads fall back to the primary. Lag is measured at most every
+# REPLICA_LAG_CHECK_INTERVAL seconds per replica: on Postgres from the
+# standby's WAL replay, elsewhere (e.g. SQLite files copied into place in
+# tests) as how far the replica's newest updated_at trails the primary's. A
+# request that commits a write sets a cookie that keeps its client on the
+# primary for REPLICA_STICKY_SECONDS, so it reads its own writes, and pages
+# read from a replica are never put in the shared page cache.
+#----------------------------------------------------------------------------#
+
+# Seconds a Postgres standby is behind its primary, 0 when it has replayed
+# everything it received.
+PG_REPLAY_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+# The newest updated_at of each table, each an index lookup.
+NEWEST_WRITE = select(
+    select(func.max(Venue.updated_at)).scalar_subquery(),
+    select(func.max(Artist.updated_at)).scalar_subquery(),
+    select(func.max(Show.updated_at)).scalar_subquery()
+)
+
+
+def _newest_write(connection):
+    stamps = [stamp for stamp in connection.execute(NEWEST_WRITE).one() if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+class _Replica(object):
+
+    def __init__(self, url):
+        self.url = make_url(url)
+        self.engine = None
+        self.lag = None
+        self.checked_at = None
+        # Guards creating the engine and measuring the lag, which needs it.
+        self.lock = threading.RLock()
+
+
+class _ReplicasState(object):
+
+    def __init__(self, app):
+        self.replicas = [_Replica(url) for url in app.config.get('DATABASE_REPLICA_URLS', ())]
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 5)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', 1)
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10)
+        self.cookie = app.config.get('REPLICA_STICKY_COOKIE', 'fyyur_primary')
+        self.turn = itertools.count()
+        self.reads = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, target):
+        with self.lock:
+            self.reads[target] += 1
+
+
+class Replicas(object):
+    """Flask extension routing read-only views to read replicas."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['replicas'] = _ReplicasState(app)
+        app.after_request(self._stick)
+
+    def _state(self):
+        return current_app.extensions['replicas']
+
+    def _engine(self, replica):
+        # Like the primary's, created on first use so that nothing connects
+        # before a server forks its workers.
+        if replica.engine is None:
+            with replica.lock:
+                if replica.engine is None:
+                    engine = create_engine(replica.url, **engine_options(current_app.config, replica.url))
+                    dispose_engine_after_fork(engine)
+                    replica.engine = engine
+        return replica.engine
+
+    def _measure_lag(self, replica):
+        engine = self._engine(replica)
+        with engine.connect() as connection:
+            if engine.dialect.name == 'postgresql':
+                return float(connection.execute(PG_REPLAY_LAG).scalar() or 0)
+            replica_newest = _newest_write(connection)
+        with db.engine.connect() as connection:
+            primary_newest = _newest_write(connection)
+        if primary_newest is None or replica_newest is not None and replica_newest >= primary_newest:
+            return 0.0
+        if replica_newest is None:
+            return float('inf')
+        return (primary_newest - replica_newest).total_seconds()
+
+    def lag(self, replica):
+        """Seconds `replica` is behind, as of its last check; inf when it
+        cannot be reached.
+        """
+        state = self._state()
+        now = time.monotonic()
+        if replica.checked_at is None or now - replica.checked_at >= state.check_interval:
+            # One request at a time measures; the others use the last value.
+            if replica.lock.acquire(blocking=replica.checked_at is None):
+                try:
+                    replica.lag = self._measure_lag(replica)
+                except Exception as e:
+                    current_app.logger.warning('read replica %s unavailable: %s', replica.url.render_as_string(), e)
+                    replica.lag = float('inf')
+                finally:
+                    replica.checked_at = now
+                    replica.lock.release()
+        return replica.lag
+
+    def choose(self):
+        """The engine the current request should read from, or None for the
+        primary.
+        """
+        state = self._state()
+        if not state.replicas:
+            return None
+        if request.cookies.get(state.cookie):
+            state.count('sticky')
+            return None
+        fresh = [replica for replica in state.replicas if self.lag(replica) <= state.max_lag]
+        if not fresh:
+            state.count('lagging')
+            return None
+        replica = fresh[next(state.turn) % len(fresh)]
+        state.count(replica.url.render_as_string())
+        return self._engine(replica)
+
+    def routed(self):
+        """Whether the current request reads from a replica."""
+        return g.get('read_engine') is not None
+
+    def reads(self, view):
+        """Decorator for views that only read: their queries go to a replica."""
+        @wraps(view)
+        def wrapper(**kwargs):
+            g.read_engine = self.choose()
+            try:
+                return view(**kwargs)
+            finally:
+                # g outlives the request when the app context was pushed
+                # around it (CLI, tests); later writes go to the primary.
+                del g.read_engine
+        return wrapper
+
+    def _stick(self, response):
+        if g.pop('committed', False):
+            state = self._state()
+            if state.replicas:
+                response.set_cookie(state.cookie, '1', max_age=state.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def stats(self):
+        """Each replica's last measured lag, and where reads went: to each
+        replica, or to the primary because the client had just written
+        ('sticky') or every replica was behind ('lagging').
+        """
+        state = self._state()
+        with state.lock:
+            reads = dict(state.reads)
+        return {
+            "replicas": [{
+                "url": replica.url.render_as_string(),
+                # None until measured, or while unreachable.
+                "lag_seconds": replica.lag if replica.lag != float('inf') else None
+            } for replica in state.replicas],
+            "reads": reads
+        }
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    # Whatever the request wrote is on the primary only for now.
+    if has_request_context():
+        g.committed = True
+
+
+# The application's replica routing; create_app() binds it.
+replicas = Replicas()
@@ -0,0 +1,180 @@
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from facets import genre_filter, genre_counts
+from db_pool import database_key, table_stamp
+from models import Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Name search.
+#
+# On Postgres, venue and artist names carry pg_trgm GIN indexes, so the
+# ILIKE '%term%' filter is answered from the index and results are ranked by
+# trigram similarity. Other databases (the SQLite test setup) use an
+# in-process n-gram index instead, built from the table on first search and
+# rebuilt once the table has changed (see db_pool.table_stamp), so that a
+# rolled-back write leaves no trace and every worker process agrees.
+#----------------------------------------------------------------------------#
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped + '%'
+
+
+class NgramIndex(object):
+    """Substring index over short strings.
+
+    Every 1-, 2- and 3-gram of a lower-cased name maps to the keys containing
+    it. A search intersects the posting lists of the term's grams, which
+    narrows the candidates to the few names sharing all of them, then checks
+    each candidate for the real substring.
+    """
+
+    def __init__(self, n=3, stamp=None):
+        self.n = n
+        # The table_stamp the index was built at.
+        self.stamp = stamp
+        self.names = {}
+        self.postings = defaultdict(set)
+
+    def _grams(self, text):
+        grams = set()
+        for size in range(1, self.n + 1):
+            for i in range(len(text) - size + 1):
+                grams.add(text[i:i + size])
+        return grams
+
+    def add(self, key, name):
+        self.remove(key)
+        name = name.lower()
+        self.names[key] = name
+        for gram in self._grams(name):
+            self.postings[gram].add(key)
+
+    def remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        for gram in self._grams(name):
+            self.postings[gram].discard(key)
+            if not self.postings[gram]:
+                del self.postings[gram]
+
+    def search(self, term, limit):
+        """Return up to `limit` keys whose name contains `term`, best first.
+
+        Ranking mirrors pg_trgm's similarity(): the share of grams the name
+        and the term have in common.
+        """
+        term = term.lower()
+        if not term:
+            return []
+        if len(term) <= self.n:
+            candidates = tuple(self.postings.get(term, ()))
+        else:
+            postings = sorted((self.postings.get(term[i:i + self.n], set())
+                               for i in range(len(term) - self.n + 1)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+
+        term_grams = self._grams(term)
+        scored = []
+        for key in candidates:
+            name = self.names[key]
+            if term in name:
+                name_grams = self._grams(name)
+                score = len(term_grams & name_grams) / float(len(term_grams | name_grams))
+                scored.append((-score, name, key))
+        scored.sort()
+        return [key for _, _, key in scored[:limit]]
+
+
+# (database url, model) -> NgramIndex, for the databases without pg_trgm.
+_indexes = {}
+
+
+def _ngram_index(session, model):
+    # Indexes are built whole and then only read, however many threads
+    # search them; a change to the table makes a new one.
+    url = database_key(session.bind.url)
+    stamp = table_stamp(session, model)
+    index = _indexes.get((url, model))
+    if index is None or index.stamp != stamp:
+        index = NgramIndex(stamp=stamp)
+        for key, name in session.query(model.id, model.name).filter(model.deleted_at.is_(None)):
+            index.add(key, name)
+        _indexes[(url, model)] = index
+    return index
+
+
+def _name_matches(model, term):
+    return model.name.ilike(_like_pattern(term), escape='\\')
+
+
+def _find(session, model, term, limit, genres=()):
+    # Matches come back with their upcoming-show counters (see show_counts)
+    # from one query, so a broad term costs the same number of statements
+    # as a narrow one.
+    query = session.query(
+        model.id,
+        model.name,
+        model.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(model.deleted_at.is_(None))
+    if genres:
+        query = query.filter(genre_filter(session, model, genres))
+
+    # A blank term lists every row, as ILIKE '%%' does, whichever backend
+    # answers it.
+    if not term.strip():
+        return query.order_by(model.name).limit(limit).all()
+
+    if session.bind.dialect.name == 'postgresql':
+        return query.filter(_name_matches(model, term)) \
+            .order_by(func.similarity(model.name, term).desc(), model.name) \
+            .limit(limit) \
+            .all()
+
+    index = _ngram_index(session, model)
+    # With a genre filter, rank every match and let the query drop the rest.
+    keys = index.search(term, len(index.names) if genres else limit)
+    if not keys:
+        return []
+    rows = dict((row.id, row) for row in query.filter(model.id.in_(keys)))
+    return [rows[key] for key in keys if key in rows][:limit]
+
+
+def find_venues(session, term, limit, genres=()):
+    """Venues whose name contains `term` (case-insensitive) and that list
+    every genre in `genres`, most relevant first, each with its
+    `num_upcoming_shows`. A blank `term` matches every venue, by name."""
+    return _find(session, Venue, term, limit, genres)
+
+
+def find_artists(session, term, limit, genres=()):
+    """Artists whose name contains `term` (case-insensitive) and that list
+    every genre in `genres`, most relevant first, each with its
+    `num_upcoming_shows`. A blank `term` matches every artist, by name."""
+    return _find(session, Artist, term, limit, genres)
+
+
+def search_genre_counts(session, model, term, genres=()):
+    """genre_counts() over every match for `term`, not just the top few."""
+    if not term.strip():
+        return genre_counts(session, model, genres)
+    if session.bind.dialect.name == 'postgresql':
+        return genre_counts(session, model, genres, _name_matches(model, term))
+    index = _ngram_index(session, model)
+    return genre_counts(session, model, genres, among=index.search(term, len(index.names)))
+
+
+def search_results(rows):
+    """Shape find_venues/find_artists rows for the search result templates."""
+    return {
+        "count": len(rows),
+        "data": [{
+            "id": row.id,
+            "name": row.name,
+            "num_upcoming_shows": row.num_upcoming_shows
+        } for row in rows]
+    }
+
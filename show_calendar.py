@@ -0,0 +1,235 @@
+import calendar
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from flask import request
+from sqlalchemy import Date, bindparam, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from facets import requested_genres, genre_filter
+from models import Venue, Artist, Show, ShowDay
+
+#----------------------------------------------------------------------------#
+# Show calendar.
+#
+# /shows and /api/v1/shows can be narrowed to a time range, a city and
+# state, a venue, an artist and artist genres, and show a month calendar of
+# how many of those shows fall on each day. Every filter is answered by an
+# index: start_time, (venue_id, start_time), (artist_id, start_time) and
+# venues (city, state). The day counts come from show_days, one row per
+# venue and day kept in the transaction that adds or removes shows, so a
+# month costs a few dozen rows per venue in view rather than a count over
+# its shows; filters by artist or genre, which show_days does not break
+# down, count the shows themselves within the month's start_time range.
+#----------------------------------------------------------------------------#
+
+_TABLE = ShowDay.__table__
+
+
+def _show_day():
+    # date() returns a date on Postgres and a 'YYYY-MM-DD' string on SQLite,
+    # which the Date type reads back as a date.
+    return func.date(Show.start_time, type_=Date)
+
+
+def parse_time(value, name):
+    """Query argument `name`, an ISO 8601 date or time, as a local wall-clock
+    datetime; raises ValueError with a message for the caller."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('%s must be an ISO 8601 date or time, e.g. 2026-10-18 or 2026-10-18T20:00' % name)
+    # Show times are local wall-clock times.
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def _id(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('%s must be an integer' % name)
+
+
+class ShowFilters(object):
+    """Which shows a listing or calendar covers; None or () means any."""
+
+    def __init__(self, start=None, end=None, city=None, state=None, venue_id=None, artist_id=None, genres=()):
+        self.start = start
+        self.end = end
+        self.city = city
+        self.state = state
+        self.venue_id = venue_id
+        self.artist_id = artist_id
+        self.genres = tuple(genres)
+        # Query arguments as given, for links that keep the filters.
+        self.args = {}
+
+    def criteria(self, session, times=True):
+        """SQL criteria over shows joined to their venues and artists.
+        `times=False` leaves out the start/end range, for calendars.
+        """
+        criteria = []
+        if times and self.start is not None:
+            criteria.append(Show.start_time >= self.start)
+        if times and self.end is not None:
+            criteria.append(Show.start_time < self.end)
+        if self.city:
+            criteria.append(Venue.city == self.city)
+        if self.state:
+            criteria.append(Venue.state == self.state)
+        if self.venue_id is not None:
+            criteria.append(Show.venue_id == self.venue_id)
+        if self.artist_id is not None:
+            criteria.append(Show.artist_id == self.artist_id)
+        if self.genres:
+            criteria.append(genre_filter(session, Artist, self.genres))
+        return criteria
+
+    def for_day(self, day):
+        """Query arguments for the shows of `day` under these filters."""
+        args = dict(self.args)
+        args['from'] = args['to'] = day.isoformat()
+        return args
+
+
+def requested_show_filters():
+    """ShowFilters from the current request's ?from=, ?to=, ?city=, ?state=,
+    ?venue_id=, ?artist_id= and ?genre=. A `to` without a time of day
+    includes that whole day. Raises ValueError naming a malformed value.
+    """
+    filters = ShowFilters(genres=requested_genres())
+    args = request.args
+    if args.get('from'):
+        filters.start = parse_time(args['from'], 'from')
+    if args.get('to'):
+        filters.end = parse_time(args['to'], 'to')
+        if 'T' not in args['to'] and ' ' not in args['to'].strip():
+            filters.end += timedelta(days=1)
+    filters.city = args.get('city', '').strip() or None
+    filters.state = args.get('state', '').strip() or None
+    if args.get('venue_id'):
+        filters.venue_id = _id(args['venue_id'], 'venue_id')
+    if args.get('artist_id'):
+        filters.artist_id = _id(args['artist_id'], 'artist_id')
+    filters.args = dict((name, args.get(name)) for name in ('from', 'to', 'city', 'state', 'venue_id', 'artist_id')
+                        if args.get(name, '').strip())
+    if filters.genres:
+        filters.args['genre'] = list(filters.genres)
+    return filters
+
+
+def requested_month(filters, today):
+    """The first day of the ?month= (YYYY-MM) to show, by default the month
+    the filters start in, or else `today`'s.
+    """
+    if request.args.get('month'):
+        try:
+            return datetime.strptime(request.args['month'], '%Y-%m').date()
+        except ValueError:
+            raise ValueError('month must be given as YYYY-MM, e.g. 2026-10')
+    day = filters.start or today
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, months):
+    """The first day of the month `months` after (or before) `month`."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def day_counts(session, first, last, filters):
+    """{day: number of shows} for first <= day < last, under `filters`
+    except their time range. Days without shows are left out.
+    """
+    if filters.artist_id is None and not filters.genres:
+        day = ShowDay.day
+        query = session.query(day, func.sum(ShowDay.show_count))
+        if filters.city or filters.state:
+            query = query.join(Venue, Venue.id == ShowDay.venue_id)
+        if filters.venue_id is not None:
+            query = query.filter(ShowDay.venue_id == filters.venue_id)
+        if filters.city:
+            query = query.filter(Venue.city == filters.city)
+        if filters.state:
+            query = query.filter(Venue.state == filters.state)
+        query = query.filter(day >= first, day < last)
+    else:
+        day = _show_day()
+        query = session.query(day, func.count(Show.id))
+        if filters.city or filters.state:
+            query = query.join(Venue, Venue.id == Show.venue_id)
+        if filters.genres:
+            query = query.join(Artist, Artist.id == Show.artist_id)
+        query = query.filter(*filters.criteria(session, times=False)) \
+            .filter(Show.start_time >= datetime.combine(first, datetime.min.time()),
+                    Show.start_time < datetime.combine(last, datetime.min.time()))
+    return dict((row_day, int(count)) for row_day, count in query.group_by(day) if count)
+
+
+def month_calendar(session, month, filters):
+    """The weeks (Monday first) shown for `month`, each a list of
+    {"date", "count", "in_month"}, with day counts under `filters`.
+    """
+    weeks = calendar.Calendar().monthdatescalendar(month.year, month.month)
+    counts = day_counts(session, weeks[0][0], weeks[-1][-1] + timedelta(days=1), filters)
+    return [[{
+        "date": day,
+        "count": counts.get(day, 0),
+        "in_month": day.month == month.month
+    } for day in week] for week in weeks]
+
+
+#  Day buckets
+#  ----------------------------------------------------------------
+
+def _upsert(session, rows):
+    dialect = session.bind.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(_TABLE)
+        session.execute(insert.on_conflict_do_update(
+            index_elements=['day', 'venue_id'],
+            set_={"show_count": _TABLE.c.show_count + insert.excluded.show_count}
+        ), rows)
+        return
+    for row in rows:
+        added = session.execute(update(_TABLE).where(_TABLE.c.day == row['day'], _TABLE.c.venue_id == row['venue_id'])
+                                .values(show_count=_TABLE.c.show_count + row['show_count']))
+        if not added.rowcount:
+            session.execute(_TABLE.insert().values(**row))
+
+
+def add_shows(session, shows):
+    """Bucket new shows, given as (venue_id, artist_id, start_time), in the
+    caller's transaction."""
+    days = Counter((venue_id, start_time.date()) for venue_id, artist_id, start_time in shows)
+    if days:
+        _upsert(session, [{"day": day, "venue_id": venue_id, "show_count": count}
+                          for (venue_id, day), count in days.items()])
+
+
+def remove_matching(session, *criteria):
+    """Unbucket the shows matching `criteria`, which are about to be deleted
+    with one bulk DELETE, in the caller's transaction. The shows are counted
+    per venue and day by the database, never loaded. Buckets left at zero
+    are kept, and read as no shows.
+    """
+    day = _show_day()
+    rows = session.query(Show.venue_id, day, func.count(Show.id)).filter(*criteria).group_by(Show.venue_id, day).all()
+    if not rows:
+        return
+    session.execute(update(_TABLE)
+                    .where(_TABLE.c.venue_id == bindparam('d_venue_id'), _TABLE.c.day == bindparam('d_day'))
+                    .values(show_count=_TABLE.c.show_count - bindparam('d_count')), [{
+                        "d_venue_id": venue_id, "d_day": row_day, "d_count": count
+                    } for venue_id, row_day, count in rows])
+
+
+def rebuild(session):
+    """Rebucket every show from the shows table and commit."""
+    day = _show_day()
+    session.execute(delete(_TABLE))
+    session.execute(_TABLE.insert().from_select(
+        ['venue_id', 'day', 'show_count'],
+        select(Show.venue_id, day, func.count(Show.id)).group_by(Show.venue_id, day)
+    ))
+    session.commit()
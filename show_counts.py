@@ -0,0 +1,143 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, select, update
+
+from models import Venue, Artist, Show, ShowCountRollover
+
+#----------------------------------------------------------------------------#
+# Denormalized show counters.
+#
+# venues and artists carry upcoming_shows_count / past_shows_count so that
+# listings read a column instead of counting shows. The counters split shows
+# at the rollover time kept in show_count_rollover, not at the wall clock:
+# writers adjust them in the transaction that adds or removes shows, and the
+# rollover job (`flask show-counts rollover`, run every minute or so) moves
+# the shows that started since the last run from upcoming to past. Writers
+# share-lock the rollover row and the job locks it exclusively, so a show
+# is never classified against a rollover time that is about to move.
+#----------------------------------------------------------------------------#
+
+_ROLLOVER_ID = 1
+
+_VENUE_TABLE = Venue.__table__
+_ARTIST_TABLE = Artist.__table__
+
+
+def _adjust_statement(table, touch):
+    values = {
+        "upcoming_shows_count": table.c.upcoming_shows_count + bindparam('d_upcoming'),
+        "past_shows_count": table.c.past_shows_count + bindparam('d_past'),
+    }
+    if touch:
+        values["updated_at"] = bindparam('d_updated_at')
+    else:
+        # Keep updated_at's onupdate default from firing.
+        values["updated_at"] = table.c.updated_at
+    return update(table).where(table.c.id == bindparam('d_id')).values(**values)
+
+
+def rolled_at(session, for_update=False):
+    """The time the counters currently split shows at, locking its row.
+
+    Creates the row (as of now) in a fresh database, where there are no
+    shows to have counted yet.
+    """
+    query = session.query(ShowCountRollover.rolled_at).filter(ShowCountRollover.id == _ROLLOVER_ID)
+    value = query.with_for_update(read=not for_update).scalar()
+    if value is None:
+        value = datetime.now()
+        session.add(ShowCountRollover(id=_ROLLOVER_ID, rolled_at=value))
+        session.flush()
+    return value
+
+
+def _apply(session, shows, sign):
+    split = rolled_at(session)
+    venues, artists = Counter(), Counter()
+    for venue_id, artist_id, start_time in shows:
+        upcoming = start_time > split
+        venues[venue_id, upcoming] += sign
+        artists[artist_id, upcoming] += sign
+    now = datetime.utcnow()
+    for table, counts in ((_VENUE_TABLE, venues), (_ARTIST_TABLE, artists)):
+        ids = set(id for id, upcoming in counts)
+        if ids:
+            # A changed count changes the row, so updated_at moves with it.
+            session.execute(_adjust_statement(table, touch=True), [{
+                "d_id": id,
+                "d_upcoming": counts[id, True],
+                "d_past": counts[id, False],
+                "d_updated_at": now
+            } for id in ids])
+
+
+def add_shows(session, shows):
+    """Count new shows, given as (venue_id, artist_id, start_time), in the
+    caller's transaction."""
+    _apply(session, shows, 1)
+
+
+def remove_shows(session, shows):
+    """Uncount shows that are being deleted, in the caller's transaction."""
+    _apply(session, shows, -1)
+
+
+def remove_matching(session, *criteria):
+    """Uncount the shows matching `criteria`, which are about to be deleted
+    with one bulk DELETE, in the caller's transaction.
+
+    Unlike remove_shows() the shows are never loaded: each table gets one
+    UPDATE that subtracts correlated counts, however many shows match.
+    """
+    split = rolled_at(session)
+    now = datetime.utcnow()
+    for table, key in ((_VENUE_TABLE, Show.venue_id), (_ARTIST_TABLE, Show.artist_id)):
+        def count(*more):
+            return select(func.count(Show.id)).where(key == table.c.id, *(criteria + more)).scalar_subquery()
+        session.execute(update(table).where(table.c.id.in_(select(key).where(*criteria))).values(
+            upcoming_shows_count=table.c.upcoming_shows_count - count(Show.start_time > split),
+            past_shows_count=table.c.past_shows_count - count(Show.start_time <= split),
+            updated_at=now
+        ))
+
+
+def rollover(session, now=None):
+    """Move the shows that started since the last rollover to past and
+    commit. Returns how many shows moved.
+    """
+    now = now or datetime.now()
+    since = rolled_at(session, for_update=True)
+    if now <= since:
+        session.rollback()
+        return 0
+    started = (Show.start_time > since, Show.start_time <= now)
+    moved = Counter()
+    for table, key in ((_VENUE_TABLE, Show.venue_id), (_ARTIST_TABLE, Show.artist_id)):
+        rows = session.query(key, func.count(Show.id)).filter(*started).group_by(key).all()
+        if rows:
+            session.execute(_adjust_statement(table, touch=False), [{
+                "d_id": id, "d_upcoming": -count, "d_past": count
+            } for id, count in rows])
+        moved[table.name] = sum(count for id, count in rows)
+    session.query(ShowCountRollover).filter(ShowCountRollover.id == _ROLLOVER_ID) \
+        .update({ShowCountRollover.rolled_at: now}, synchronize_session=False)
+    session.commit()
+    return moved['venues']
+
+
+def rebuild(session, now=None):
+    """Recount every venue and artist from the shows table and commit."""
+    now = now or datetime.now()
+    rolled_at(session, for_update=True)
+    for table, key in ((_VENUE_TABLE, Show.venue_id), (_ARTIST_TABLE, Show.artist_id)):
+        def count(*criteria):
+            return select(func.count(Show.id)).where(key == table.c.id, *criteria).scalar_subquery()
+        session.execute(update(table).values(
+            upcoming_shows_count=count(Show.start_time > now),
+            past_shows_count=count(Show.start_time <= now),
+            updated_at=table.c.updated_at
+        ))
+    session.query(ShowCountRollover).filter(ShowCountRollover.id == _ROLLOVER_ID) \
+        .update({ShowCountRollover.rolled_at: now}, synchronize_session=False)
+    session.commit()
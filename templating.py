@@ -0,0 +1,114 @@
+import os
+import stat
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache import LRUBackend, MISSING
+
+#----------------------------------------------------------------------------#
+# Template rendering.
+#
+# List pages render one tile per venue, artist or show, and most tiles look
+# the same from one request to the next. `{% cache key, ... %}` keeps the
+# rendered HTML of a block under a key built from the entity's version
+# stamps (id, updated_at and whatever else the tile prints), so a tile is
+# rendered again only once its entity changes, and stale versions simply age
+# out of the LRU. Compiled templates go to a bytecode cache on disk that all
+# workers share, so a new worker loads them instead of compiling them.
+#----------------------------------------------------------------------------#
+
+
+class _FragmentCacheState(object):
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+
+class FragmentCacheExtension(Extension):
+    """The `{% cache part, ... %}...{% endcache %}` tag."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        state = self.environment.fragment_cache
+        key = repr(parts)
+        fragment = state.backend.get(key)
+        if fragment is not MISSING:
+            state.hits += 1
+            return fragment
+        state.misses += 1
+        fragment = caller()
+        state.backend.set(key, fragment, state.ttl)
+        return fragment
+
+
+def bytecode_cache(config):
+    """The FileSystemBytecodeCache for TEMPLATE_BYTECODE_CACHE_DIR, or by
+    default for Jinja's private per-user directory under the temp dir.
+
+    The cache holds marshalled code that Jinja loads and runs, so a
+    configured directory is created readable by this user only, and one
+    another user owns or can write to is refused.
+    """
+    directory = config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if not directory:
+        return FileSystemBytecodeCache()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise RuntimeError('TEMPLATE_BYTECODE_CACHE_DIR %s must be owned, and only writable, by uid %d'
+                           % (directory, os.getuid()))
+    return FileSystemBytecodeCache(directory)
+
+
+class Templating(object):
+    """Flask extension adding the fragment cache and the bytecode cache to
+    the application's Jinja environment.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        environment = app.jinja_env
+        environment.add_extension(FragmentCacheExtension)
+        environment.extend(fragment_cache=_FragmentCacheState(
+            LRUBackend(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)),
+            app.config.get('FRAGMENT_CACHE_TTL', 3600)))
+        if app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+            environment.bytecode_cache = bytecode_cache(app.config)
+
+    def compile_all(self):
+        """Load every template once, filling the bytecode cache. Returns the
+        number of templates loaded.
+        """
+        environment = current_app.jinja_env
+        names = environment.list_templates(filter_func=lambda name: name.endswith('.html'))
+        for name in names:
+            environment.get_template(name)
+        return len(names)
+
+    def stats(self):
+        state = current_app.jinja_env.fragment_cache
+        return {
+            "hits": state.hits,
+            "misses": state.misses
+        }
+
+
+# The application's template setup; create_app() binds it.
+templating = Templating()